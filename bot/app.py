@@ -0,0 +1,101 @@
+"""
+Запуск бота: создание Bot и Dispatcher, подключение роутеров и middleware.
+"""
+import asyncio
+from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from .config import BOT_TOKEN, logger, QUEUE_EMBEDDED_WORKER, FSM_STORAGE, BOT_MODE, DISPATCH_MAX_PENDING
+from .handlers import command_router, image_router, generation_router, payment_router
+from .database import setup_database
+from .repositories.pool import open_pools, close_pools
+from .repositories.fsm_storage import SQLiteFSMStorage
+from .middleware.rate_limit import RateLimitMiddleware, GenerationRateLimitMiddleware
+from .middleware.update_dispatch import OrderedDispatchMiddleware
+from .services import queue_service, maintenance_service
+from .services.image_service import shutdown_executor
+from .services.telegram_service import start_http_session, close_http_session
+from .webhook import run_webhook
+
+bot = Bot(token=BOT_TOKEN)
+# Состояния FSM переживают перезапуск; память ограничена кэшем хранилища
+storage = SQLiteFSMStorage() if FSM_STORAGE == "sqlite" else MemoryStorage()
+dp = Dispatcher(storage=storage)
+
+async def main() -> None:
+    """Главная функция"""
+    # Инициализируем базу данных
+    await setup_database()
+    
+    # Открываем общий пул соединений для репозиториев
+    await open_pools()
+    
+    # Общая HTTP-сессия для скачивания изображений из Telegram
+    await start_http_session()
+    
+    # Инициализируем сервис очереди
+    queue_service.set_bot(bot)
+    
+    # Очередь может обрабатываться отдельными процессами (worker.py)
+    queue_service.set_worker_enabled(QUEUE_EMBEDDED_WORKER)
+    
+    # Восстанавливаем очередь после перезапуска
+    await queue_service.restore_queue()
+    
+    # Удаление устаревших сессий и зависших задач вне пути обработки запросов
+    maintenance_service.start_janitor()
+    
+    # Добавляем middleware
+    # Обновления разных пользователей обрабатываются параллельно, одного - по порядку
+    dp.update.outer_middleware(OrderedDispatchMiddleware())
+    
+    # Увеличиваем лимиты для защиты только от явного спама
+    message_rate_limit = RateLimitMiddleware(rate_limit=100, window_seconds=60, scope="message")  # 100 сообщений в минуту
+    callback_rate_limit = RateLimitMiddleware(rate_limit=200, window_seconds=60, scope="callback")  # 200 нажатий кнопок в минуту
+    dp.message.middleware(message_rate_limit)
+    dp.callback_query.middleware(callback_rate_limit)
+    
+    # Специальный rate limit для генерации - убираем, так как у нас есть баланс
+    # generation_router.message.middleware(GenerationRateLimitMiddleware())
+    
+    # Регистрируем роутеры
+    dp.include_router(command_router)
+    dp.include_router(image_router)
+    dp.include_router(generation_router)
+    dp.include_router(payment_router)
+    
+    # Обработчик остановки
+    async def on_shutdown():
+        logger.info("Остановка бота...")
+        await queue_service.pause_queue()
+        await queue_service.cancel_all_tasks()
+        logger.info("Очередь остановлена")
+        # Только после остановки генераций: отправка результата открыла бы сессию заново
+        await bot.session.close()
+        await maintenance_service.stop_janitor()
+        await message_rate_limit.close()
+        await callback_rate_limit.close()
+        await close_pools()
+        await close_http_session()
+        shutdown_executor()
+    
+    # Запускаем бота. Хранилище FSM сохраняет изменения при остановке
+    # polling'а или webhook'а (до закрытия пула в on_shutdown)
+    logger.info(f"Бот запущен ({BOT_MODE})")
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            # Polling не работает, пока установлен webhook
+            await bot.delete_webhook()
+            # Сверх DISPATCH_MAX_PENDING необработанных обновлений polling ждет
+            await dp.start_polling(
+                bot,
+                tasks_concurrency_limit=max(1, DISPATCH_MAX_PENDING),
+                close_bot_session=False
+            )
+    finally:
+        await on_shutdown()
+
+if __name__ == "__main__":
+    asyncio.run(main())
\ No newline at end of file
@@ -47,9 +47,85 @@ ADMIN_ID = safe_int(os.getenv("ADMIN_ID", "0"), 0)  # ID админа для к
 GENERATION_PRICE = safe_int(os.getenv("GENERATION_PRICE", "20"), 20)  # Stars
 MAX_IMAGES_PER_REQUEST = safe_int(os.getenv("MAX_IMAGES_PER_REQUEST", "3"), 3)  # Максимум изображений для редактирования
 MAX_PROMPT_LENGTH = safe_int(os.getenv("MAX_PROMPT_LENGTH", "1000"), 1000)  # Максимальная длина промпта
-OPENAI_CONCURRENT_LIMIT = safe_int(os.getenv("OPENAI_CONCURRENT_LIMIT", "5"), 5)  # Лимит одновременных запросов к OpenAI API
+OPENAI_CONCURRENT_LIMIT = safe_int(os.getenv("OPENAI_CONCURRENT_LIMIT", "5"), 5)  # Начальный лимит одновременных запросов к OpenAI API
+OPENAI_CONCURRENT_MIN = safe_int(os.getenv("OPENAI_CONCURRENT_MIN", "1"), 1)  # Нижняя граница адаптивного лимита
+OPENAI_CONCURRENT_MAX = safe_int(os.getenv("OPENAI_CONCURRENT_MAX", "20"), 20)  # Верхняя граница адаптивного лимита
+OPENAI_TIMEOUT_SECONDS = safe_int(os.getenv("OPENAI_TIMEOUT_SECONDS", "180"), 180)  # Бюджет одного запроса к OpenAI в секундах
+OPENAI_BREAKER_FAILURES = safe_int(os.getenv("OPENAI_BREAKER_FAILURES", "5"), 5)  # Сбоев OpenAI подряд до паузы в отправке запросов
+OPENAI_BREAKER_RECOVERY_SECONDS = safe_int(os.getenv("OPENAI_BREAKER_RECOVERY_SECONDS", "30"), 30)  # Пауза до пробного запроса после сбоев
+OPENAI_LATENCY_TARGET = safe_int(os.getenv("OPENAI_LATENCY_TARGET", "150"), 150)  # p90 задержки генерации в секундах, выше которого лимит снижается (0 - не учитывать)
 SESSION_EXPIRE_MINUTES = safe_int(os.getenv("SESSION_EXPIRE_MINUTES", "60"), 60)  # Время жизни сессии оплаты в минутах
 
+# Мемоизация генераций по тексту промпта (только без входных изображений)
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "false").lower() == "true"  # Переиспользовать результат одинаковых промптов
+PROMPT_CACHE_TTL_SECONDS = safe_int(os.getenv("PROMPT_CACHE_TTL_SECONDS", "3600"), 3600)  # Время жизни результата в кэше
+PROMPT_CACHE_MAX_ENTRIES = safe_int(os.getenv("PROMPT_CACHE_MAX_ENTRIES", "50"), 50)  # Максимум сохранённых результатов
+
+# Настройки очереди генераций
+QUEUE_POLL_INTERVAL = safe_int(os.getenv("QUEUE_POLL_INTERVAL", "30"), 30)  # Страховочный опрос очереди в секундах
+QUEUE_LEASE_SECONDS = safe_int(os.getenv("QUEUE_LEASE_SECONDS", "120"), 120)  # Срок аренды задачи worker'ом
+QUEUE_HEARTBEAT_SECONDS = safe_int(os.getenv("QUEUE_HEARTBEAT_SECONDS", "30"), 30)  # Интервал продления аренды
+QUEUE_PREFETCH = safe_int(os.getenv("QUEUE_PREFETCH", "2"), 2)  # Задач сверх лимита OpenAI, готовящих входные данные заранее
+QUEUE_MAX_ATTEMPTS = safe_int(os.getenv("QUEUE_MAX_ATTEMPTS", "3"), 3)  # Попыток генерации при временных ошибках до возврата оплаты
+QUEUE_RETRY_BASE_DELAY = safe_int(os.getenv("QUEUE_RETRY_BASE_DELAY", "10"), 10)  # Задержка перед первым повтором в секундах
+QUEUE_RETRY_MAX_DELAY = safe_int(os.getenv("QUEUE_RETRY_MAX_DELAY", "300"), 300)  # Максимальная задержка перед повтором
+JOB_DEADLINE_SECONDS = safe_int(os.getenv("JOB_DEADLINE_SECONDS", "600"), 600)  # Общий бюджет обработки задачи в секундах
+DOWNLOAD_TIMEOUT_SECONDS = safe_int(os.getenv("DOWNLOAD_TIMEOUT_SECONDS", "60"), 60)  # Бюджет скачивания и предобработки фото
+DELIVERY_TIMEOUT_SECONDS = safe_int(os.getenv("DELIVERY_TIMEOUT_SECONDS", "60"), 60)  # Бюджет отправки результата в Telegram
+QUEUE_STALE_MINUTES = safe_int(os.getenv("QUEUE_STALE_MINUTES", "30"), 30)  # Через сколько минут задача без аренды в processing считается зависшей
+QUEUE_EMBEDDED_WORKER = os.getenv("QUEUE_EMBEDDED_WORKER", "true").lower() == "true"  # Обрабатывать очередь в процессе бота
+
+# Фоновое обслуживание БД
+MAINTENANCE_INTERVAL_SECONDS = safe_int(os.getenv("MAINTENANCE_INTERVAL_SECONDS", "60"), 60)  # Интервал обслуживания (0 - не запускать в этом процессе)
+MAINTENANCE_BATCH_SIZE = safe_int(os.getenv("MAINTENANCE_BATCH_SIZE", "500"), 500)  # Строк за одну транзакцию
+MAINTENANCE_BATCH_PAUSE_MS = safe_int(os.getenv("MAINTENANCE_BATCH_PAUSE_MS", "100"), 100)  # Пауза между пачками в миллисекундах
+MAINTENANCE_MAX_BATCHES = safe_int(os.getenv("MAINTENANCE_MAX_BATCHES", "20"), 20)  # Пачек одного вида за проход, остальное - в следующий
+QUEUE_RETENTION_DAYS = safe_int(os.getenv("QUEUE_RETENTION_DAYS", "30"), 30)  # Через сколько дней завершенные задачи переносятся в историю (0 - не переносить)
+MAINTENANCE_VACUUM_PAGES = safe_int(os.getenv("MAINTENANCE_VACUUM_PAGES", "1000"), 1000)  # Свободных страниц БД, возвращаемых ОС за проход (0 - не возвращать)
+
+# Загрузка и предобработка входных изображений
+DOWNLOAD_CONCURRENCY_PER_JOB = safe_int(os.getenv("DOWNLOAD_CONCURRENCY_PER_JOB", "3"), 3)  # Параллельных загрузок на одну задачу
+TELEGRAM_HTTP_LIMIT = safe_int(os.getenv("TELEGRAM_HTTP_LIMIT", "100"), 100)  # Всего соединений для скачивания файлов
+TELEGRAM_HTTP_LIMIT_PER_HOST = safe_int(os.getenv("TELEGRAM_HTTP_LIMIT_PER_HOST", "20"), 20)  # Соединений к одному хосту
+TELEGRAM_HTTP_KEEPALIVE = safe_int(os.getenv("TELEGRAM_HTTP_KEEPALIVE", "60"), 60)  # Keep-alive соединений в секундах
+IMAGE_CACHE_MEMORY_MB = safe_int(os.getenv("IMAGE_CACHE_MEMORY_MB", "64"), 64)  # Кэш скачанных изображений в памяти
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "")  # Директория дискового кэша (пусто - только память)
+IMAGE_CACHE_DISK_MB = safe_int(os.getenv("IMAGE_CACHE_DISK_MB", "512"), 512)  # Размер дискового кэша
+RESULT_CACHE_MEMORY_MB = safe_int(os.getenv("RESULT_CACHE_MEMORY_MB", "32"), 32)  # Кэш сгенерированных изображений в памяти
+IMAGE_PREPROCESS_ENABLED = os.getenv("IMAGE_PREPROCESS_ENABLED", "true").lower() == "true"  # Уменьшать и перекодировать фото перед OpenAI
+IMAGE_MAX_SIDE = safe_int(os.getenv("IMAGE_MAX_SIDE", "1024"), 1024)  # Максимальная сторона изображения в пикселях
+IMAGE_JPEG_QUALITY = safe_int(os.getenv("IMAGE_JPEG_QUALITY", "90"), 90)  # Качество JPEG после перекодирования
+IMAGE_PROCESS_WORKERS = safe_int(os.getenv("IMAGE_PROCESS_WORKERS", "2"), 2)  # Процессов для предобработки
+
+# Настройки базы данных
+DB_READ_POOL_SIZE = safe_int(os.getenv("DB_READ_POOL_SIZE", "4"), 4)  # Количество соединений на чтение в пуле
+DB_PRAGMA_PROFILE = os.getenv("DB_PRAGMA_PROFILE", "durable").lower()  # Профиль PRAGMA: durable или fast
+
+# Ограничение частоты запросов пользователей
+RATE_LIMIT_MAX_USERS = safe_int(os.getenv("RATE_LIMIT_MAX_USERS", "100000"), 100000)  # Пользователей в памяти rate limiter'а
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()  # memory - в процессе, sqlite - общие счетчики в bot_data.db
+RATE_LIMIT_SYNC_INTERVAL = safe_int(os.getenv("RATE_LIMIT_SYNC_INTERVAL", "1"), 1)  # Раз в сколько секунд синхронизировать счетчики с БД
+
+# Режим получения обновлений Telegram
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()  # polling - long polling, webhook - HTTP-сервер
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # Публичный адрес бота, например https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")  # Путь, на который Telegram отправляет обновления
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # Секретный токен в заголовке X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")  # Адрес, на котором слушает HTTP-сервер
+WEBHOOK_PORT = safe_int(os.getenv("WEBHOOK_PORT", "8080"), 8080)  # Порт HTTP-сервера
+WEBHOOK_DRAIN_SECONDS = safe_int(os.getenv("WEBHOOK_DRAIN_SECONDS", "30"), 30)  # Ожидание обработки принятых обновлений при остановке
+
+# Параллельная обработка обновлений
+DISPATCH_WORKERS = safe_int(os.getenv("DISPATCH_WORKERS", "16"), 16)  # Одновременно обрабатываемых обновлений (разных пользователей)
+DISPATCH_MAX_PENDING = safe_int(os.getenv("DISPATCH_MAX_PENDING", "1000"), 1000)  # Принятых, но не обработанных обновлений всего
+DISPATCH_MAX_PENDING_PER_USER = safe_int(os.getenv("DISPATCH_MAX_PENDING_PER_USER", "20"), 20)  # Необработанных обновлений одного пользователя (сверх - отбрасываются)
+
+# Хранилище состояний FSM
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite").lower()  # sqlite - в bot_data.db, memory - в памяти процесса
+FSM_CACHE_MAX_ENTRIES = safe_int(os.getenv("FSM_CACHE_MAX_ENTRIES", "10000"), 10000)  # Ключей FSM в кэше памяти
+FSM_TTL_HOURS = safe_int(os.getenv("FSM_TTL_HOURS", "24"), 24)  # Через сколько часов без изменений состояние сбрасывается
+FSM_FLUSH_INTERVAL = safe_int(os.getenv("FSM_FLUSH_INTERVAL", "2"), 2)  # Интервал записи изменений FSM в БД в секундах
+
 # Конфигурация пакетов генераций
 # Каждый пакет определяет количество генераций и цену в Stars
 PACKAGES = [
@@ -78,4 +154,7 @@ INVOICE_PHOTO_URL = os.getenv(
 )
 
 if not BOT_TOKEN or not OPENAI_API_KEY:
-    raise ValueError("Необходимо установить BOT_TOKEN и OPENAI_API_KEY в .env файле")
\ No newline at end of file
+    raise ValueError("Необходимо установить BOT_TOKEN и OPENAI_API_KEY в .env файле")
+
+if BOT_MODE == "webhook" and not WEBHOOK_URL:
+    raise ValueError("Для BOT_MODE=webhook необходимо установить WEBHOOK_URL")
\ No newline at end of file
@@ -2,8 +2,9 @@ import asyncio
 from pathlib import Path
 
 from .repositories.sqlite import init_database
+from .repositories.pool import open_connection, get_pragma_profile
 from .migrations.migration_system import MigrationSystem
-from .config import logger
+from .config import logger, DB_PRAGMA_PROFILE
 
 
 async def setup_database() -> None:
@@ -19,6 +20,14 @@ async def setup_database() -> None:
         # (на случай если БД уже существует без миграций)
         await init_database(str(db_path))
         
+        # Проверяем, что профиль PRAGMA действительно применился
+        async with open_connection(str(db_path)) as db:
+            async with db.execute("PRAGMA journal_mode") as cursor:
+                row = await cursor.fetchone()
+                journal_mode = row[0] if row else "unknown"
+        
+        settings = ", ".join(f"{name}={value}" for name, value in get_pragma_profile(DB_PRAGMA_PROFILE))
+        logger.info(f"Профиль БД '{DB_PRAGMA_PROFILE}': {settings} (journal_mode={journal_mode})")
         logger.info(f"База данных настроена: {db_path.absolute()}")
     except (IOError, OSError, RuntimeError) as e:
         logger.error(f"Ошибка настройки БД: {e}")
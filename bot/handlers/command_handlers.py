@@ -5,7 +5,7 @@ from aiogram.fsm.context import FSMContext
 
 from ..states import ImageGenerationStates
 from ..config import logger, ADMIN_ID, GENERATION_PRICE, MAX_IMAGES_PER_REQUEST
-from ..services import payment_service, balance_service
+from ..services import payment_service, balance_service, queue_service, maintenance_service
 from .. import messages
 
 command_router = Router()
@@ -65,6 +65,19 @@ async def balance_command(message: Message) -> None:
         )
 
 
+@command_router.message(Command("result"))
+async def result_command(message: Message) -> None:
+    """Повторно прислать последний результат (по file_id, без загрузки)"""
+    try:
+        sent = await queue_service.resend_last_result(message.from_user.id)
+    except Exception as e:
+        logger.error(f"Ошибка повторной отправки результата пользователю {message.from_user.id}: {e}")
+        await message.answer(messages.ERROR_SESSION_CREATE)
+        return
+    if not sent:
+        await message.answer(messages.RESULT_NOT_FOUND)
+
+
 @command_router.message(Command("paysupport"))
 async def cmd_paysupport(message: Message) -> None:
     """Поддержка по платежам"""
@@ -108,6 +121,45 @@ async def cmd_refund(message: Message) -> None:
         await message.answer(f"❌ Ошибка при обработке команды")
 
 
+@command_router.message(Command("status"))
+async def cmd_status(message: Message) -> None:
+    """Состояние очереди, лимита OpenAI и обслуживания БД (только для админа)"""
+    if message.from_user.id != ADMIN_ID:
+        await message.answer(messages.REFUND_NO_PERMISSION)
+        return
+    
+    stats = await queue_service.get_queue_stats()
+    openai_stats = stats["openai"]
+    maintenance_stats = maintenance_service.maintenance_stats
+    
+    def seconds(value):
+        return f"{value:.1f}s" if value is not None else "—"
+    
+    await message.answer(
+        messages.STATUS_MESSAGE.format(
+            pending=stats["pending"],
+            active=stats["active"],
+            paused=messages.STATUS_PAUSED if stats["paused"] else "",
+            limit=openai_stats["limit"],
+            in_flight=openai_stats["in_flight"],
+            waiting=openai_stats["waiting"],
+            latency_p50=seconds(openai_stats["latency_p50"]),
+            latency_p90=seconds(openai_stats["latency_p90"]),
+            remaining_requests=openai_stats["remaining_requests"] if openai_stats["remaining_requests"] is not None else "—",
+            rate_limited=openai_stats["rate_limited"],
+            breaker_state=stats["breaker"]["state"],
+            breaker_failures=stats["breaker"]["failures"],
+            maintenance_last_run=maintenance_stats["last_run_at"] or "—",
+            maintenance_duration=seconds(maintenance_stats["last_duration"]),
+            sessions_expired=maintenance_stats["sessions_expired"],
+            stale_items_failed=maintenance_stats["stale_items_failed"],
+            items_archived=maintenance_stats["items_archived"],
+            pages_vacuumed=maintenance_stats["pages_vacuumed"]
+        ),
+        parse_mode="HTML"
+    )
+
+
 @command_router.message(F.text == "🔄 Начать заново")
 async def reset_state(message: Message, state: FSMContext) -> None:
     """Сброс состояния и начало заново"""
@@ -6,7 +6,7 @@ from ..states import ImageGenerationStates
 from ..config import TEST_MODE, logger, GENERATION_PRICE, MAX_PROMPT_LENGTH, OPENAI_CONCURRENT_LIMIT, MAX_IMAGES_PER_REQUEST
 from ..services import payment_service, balance_service
 from ..services.telegram_service import download_image
-from ..services.openai_service import generate_image, GenerationError, generation_semaphore
+from ..services.openai_service import generate_image, GenerationError
 from ..services import queue_service
 from ..keyboards.package_keyboards import get_package_keyboard, get_reset_keyboard, get_retry_inline_keyboard
 from .. import messages
@@ -20,9 +20,10 @@ async def handle_photo_only(message: Message, state: FSMContext) -> None:
     data = await state.get_data()
     images = data.get('images', [])
     
-    # Добавляем фото
+    # Добавляем фото. file_unique_id не меняется для одного и того же файла
+    # и служит ключом кэша скачанных изображений
     photo = message.photo[-1]
-    images.append(photo.file_id)
+    images.append({'file_id': photo.file_id, 'file_unique_id': photo.file_unique_id})
     
     # Проверяем, есть ли caption (текст с фото)
     if message.caption:
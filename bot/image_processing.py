@@ -0,0 +1,34 @@
+"""
+Обработка изображений в процессах пула предобработки.
+
+Дочерний процесс (spawn) импортирует этот модуль заново, поэтому здесь
+нет импортов конфигурации, репозиториев и сервисов бота - только PIL.
+"""
+import io
+
+from PIL import Image, ImageOps
+
+
+def preprocess_image_sync(data: bytes, max_side: int, jpeg_quality: int) -> bytes:
+    """Уменьшить изображение, перекодировать и удалить метаданные.
+
+    Выполняется в отдельном процессе, поэтому не должна обращаться к состоянию бота.
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        # Применяем поворот из EXIF до удаления метаданных
+        image = ImageOps.exif_transpose(source)
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+
+        has_alpha = (
+            image.mode in ("RGBA", "LA")
+            or (image.mode == "P" and "transparency" in image.info)
+        )
+
+        output = io.BytesIO()
+        if has_alpha:
+            # Прозрачность важна для редактирования - сохраняем PNG
+            image.convert("RGBA").save(output, format="PNG", optimize=True)
+        else:
+            image.convert("RGB").save(output, format="JPEG", quality=jpeg_quality, optimize=True)
+
+        return output.getvalue()
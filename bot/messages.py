@@ -19,6 +19,7 @@ START_MESSAGE = """🎨 Добро пожаловать в бот генерац
 Команды:
 /generate - Начать генерацию
 /balance - Проверить баланс
+/result - Прислать последний результат еще раз
 /help - Подробная инструкция"""
 
 HELP_MESSAGE = """📖 <b>Как использовать бот:</b>
@@ -115,6 +116,12 @@ GENERATION_SUCCESS = """✨ <b>Готово!</b>
 
 <i>{footer}</i>"""
 
+GENERATION_RETRY_SCHEDULED = """⏳ Сервис генерации временно недоступен.
+🔄 Мы автоматически повторим попытку, ничего делать не нужно."""
+
+RESULT_RESENT = "🖼 Ваш последний результат"
+RESULT_NOT_FOUND = "У вас пока нет готовых изображений. Начните генерацию: /generate"
+
 GENERATION_SUCCESS_FOOTER_TEST = "🧪 Тестовый режим"
 GENERATION_SUCCESS_FOOTER_PAID = "Спасибо за покупку!"
 
@@ -171,6 +178,23 @@ REFUND_USAGE = """Использование: /refund <user_id> <payment_charge_
 Пример: /refund 123456789 payment_12345"""
 REFUND_INVALID_USER_ID = "❌ Неверный формат user_id"
 
+# Состояние генераций (для админа)
+STATUS_MESSAGE = """📊 <b>Состояние генераций</b>
+
+В очереди: {pending}
+В обработке: {active}{paused}
+
+Лимит OpenAI: {limit} (активно: {in_flight}, ожидают: {waiting})
+Задержка p50 / p90: {latency_p50} / {latency_p90}
+Остаток запросов: {remaining_requests}
+Ответов 429: {rate_limited}
+Circuit breaker: {breaker_state} (сбоев подряд: {breaker_failures})
+
+Обслуживание: {maintenance_last_run} ({maintenance_duration})
+Удалено сессий: {sessions_expired}, зависших задач: {stale_items_failed}
+В историю: {items_archived}, освобождено страниц: {pages_vacuumed}"""
+STATUS_PAUSED = " (очередь на паузе)"
+
 # ============================================================================
 # ОШИБКИ OPENAI
 # ============================================================================
@@ -1,25 +1,347 @@
-from typing import Callable, Dict, Any, Awaitable
-from datetime import datetime, timedelta
+from typing import Callable, Dict, Any, Awaitable, Iterable, Optional, Tuple
+from abc import ABC, abstractmethod
+from collections import OrderedDict
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery
 import asyncio
+import time
 
-from ..config import logger
+from ..config import logger, RATE_LIMIT_MAX_USERS, RATE_LIMIT_BACKEND, RATE_LIMIT_SYNC_INTERVAL
+from ..repositories.pool import get_pool
+
+# Сколько пользователей читать из БД одним запросом (лимит параметров SQLite)
+_READ_CHUNK = 500
+
+
+def sliding_window_wait(
+    rate_limit: int,
+    window: float,
+    elapsed: float,
+    previous: float,
+    current: float
+) -> float:
+    """Проверка скользящего окна со счетчиками.
+
+    Число запросов за последние window секунд оценивается как
+    previous * (доля предыдущего окна, попадающая в скользящее) + current.
+    Возвращает 0, если запрос разрешен, иначе - сколько секунд ждать.
+    """
+    previous_weight = 1 - elapsed / window
+    estimated = previous * previous_weight + current
+    if estimated + 1 <= rate_limit:
+        return 0.0
+
+    # Когда оценка опустится ниже лимита (результат всегда больше нуля)
+    if current >= rate_limit or not previous:
+        return window - elapsed
+    needed_weight = (rate_limit - 1 - current) / previous
+    return max(0.001, (previous_weight - needed_weight) * window)
+
+
+class _UserWindow:
+    """Счетчики пользователя в текущем и предыдущем окне"""
+
+    __slots__ = ("window_start", "current", "previous")
+
+    def __init__(self, window_start: float) -> None:
+        self.window_start = window_start
+        self.current = 0
+        self.previous = 0
+
+
+class SlidingWindowCounter:
+    """Ограничение частоты скользящим окном со счетчиками.
+
+    Проверка - O(1) по времени и памяти на пользователя. Хранится не больше
+    max_users пользователей, давно не писавшие вытесняются.
+    """
+
+    def __init__(self, rate_limit: int, window_seconds: float, max_users: int = RATE_LIMIT_MAX_USERS) -> None:
+        self.rate_limit = rate_limit
+        self.window = float(window_seconds)
+        self.max_users = max(1, max_users)
+        self._users: "OrderedDict[int, _UserWindow]" = OrderedDict()
+
+    def _get_window(self, key: int, now: float) -> _UserWindow:
+        state = self._users.get(key)
+        if state is None:
+            state = _UserWindow(now)
+            self._users[key] = state
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(key)
+
+            # Сдвигаем окно: счетчик текущего становится предыдущим
+            elapsed_windows = int((now - state.window_start) // self.window)
+            if elapsed_windows > 0:
+                state.previous = state.current if elapsed_windows == 1 else 0
+                state.current = 0
+                state.window_start += elapsed_windows * self.window
+        return state
+
+    def hit(self, key: int, now: Optional[float] = None) -> float:
+        """Учесть запрос. Возвращает 0, если он разрешен, иначе - сколько секунд ждать"""
+        if now is None:
+            now = time.monotonic()
+        state = self._get_window(key, now)
+
+        wait_time = sliding_window_wait(
+            self.rate_limit, self.window, now - state.window_start, state.previous, state.current
+        )
+        if wait_time == 0:
+            state.current += 1
+        return wait_time
+
+
+class RateLimitBackend(ABC):
+    """Хранилище счетчиков запросов пользователей"""
+
+    @abstractmethod
+    async def hit(self, key: int) -> float:
+        """Учесть запрос. Возвращает 0, если он разрешен, иначе - сколько секунд ждать"""
+        pass
+
+    async def close(self) -> None:
+        """Сохранить несохраненные счетчики и остановить фоновые задачи"""
+        pass
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """Счетчики в памяти процесса"""
+
+    def __init__(self, rate_limit: int, window_seconds: float) -> None:
+        self.counter = SlidingWindowCounter(rate_limit, window_seconds)
+
+    async def hit(self, key: int) -> float:
+        return self.counter.hit(key)
+
+
+class _SharedCounters:
+    """Снимок счетчиков пользователя из БД"""
+
+    __slots__ = ("last_window", "counts")
+
+    def __init__(self, last_window: int, counts: Dict[int, int]) -> None:
+        self.last_window = last_window  # Окно последнего запроса пользователя в этот процесс
+        self.counts = counts  # номер окна -> количество запросов (все процессы)
+
+
+class SQLiteRateLimitBackend(RateLimitBackend):
+    """Общие для нескольких процессов счетчики в таблице rate_limit_counters.
+
+    Окна выровнены по системному времени, чтобы совпадать во всех процессах.
+    Решение принимается по локальному снимку счетчиков пользователя без
+    обращения к БД: снимок читается при первом запросе пользователя и живет,
+    пока его окна участвуют в оценке. Новые запросы копятся в памяти и раз в
+    sync_interval секунд записываются одной транзакцией, после чего снимки
+    всех хранимых пользователей перечитываются. Лимит может быть превышен не
+    больше чем на запросы, пришедшие в другие процессы за sync_interval.
+    """
+
+    def __init__(
+        self,
+        scope: str,
+        rate_limit: int,
+        window_seconds: float,
+        db_path: str = "bot_data.db",
+        sync_interval: float = RATE_LIMIT_SYNC_INTERVAL,
+        max_users: int = RATE_LIMIT_MAX_USERS
+    ) -> None:
+        self.scope = scope
+        self.rate_limit = rate_limit
+        self.window = float(window_seconds)
+        self.sync_interval = max(0.1, sync_interval)
+        self.max_users = max(1, max_users)
+        self.pool = get_pool(db_path)
+
+        # user_id -> снимок из БД, в порядке последнего запроса, не больше max_users
+        self._shared: "OrderedDict[int, _SharedCounters]" = OrderedDict()
+        # (user_id, номер окна) -> количество запросов этого процесса
+        self._flushing: Dict[Tuple[int, int], int] = {}  # Записываются, но еще не в снимке
+        self._pending: Dict[Tuple[int, int], int] = {}  # Еще не записаны
+        self._sync_task: Optional[asyncio.Task] = None
+
+    def _count(self, key: int, shared: _SharedCounters, window_index: int) -> int:
+        counter_key = (key, window_index)
+        return (
+            shared.counts.get(window_index, 0)
+            + self._flushing.get(counter_key, 0)
+            + self._pending.get(counter_key, 0)
+        )
+
+    async def _read(self, keys: Iterable[int], since_window: int) -> Dict[int, Dict[int, int]]:
+        """Прочитать счетчики пользователей начиная с окна since_window"""
+        keys = list(keys)
+        result: Dict[int, Dict[int, int]] = {key: {} for key in keys}
+        async with self.pool.reader() as db:
+            for i in range(0, len(keys), _READ_CHUNK):
+                chunk = keys[i:i + _READ_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                async with db.execute(f"""
+                    SELECT user_id, window_index, count FROM rate_limit_counters
+                    WHERE scope = ? AND window_index >= ? AND user_id IN ({placeholders})
+                """, (self.scope, since_window, *chunk)) as cursor:
+                    for row in await cursor.fetchall():
+                        result[row[0]][row[1]] = row[2]
+        return result
+
+    async def _get_shared(self, key: int, window_index: int) -> _SharedCounters:
+        shared = self._shared.get(key)
+        if shared is not None:
+            self._shared.move_to_end(key)
+            return shared
+
+        # Первый запрос пользователя (или первый после окна без запросов)
+        try:
+            counts = (await self._read([key], window_index - 1))[key]
+        except Exception as e:
+            # Без БД работаем по локальным счетчикам, а не блокируем апдейты
+            logger.error(f"Ошибка чтения счетчиков rate limit ({self.scope}): {e}")
+            counts = {}
+
+        # Пока шло чтение, снимок мог появиться от другого запроса
+        shared = self._shared.setdefault(key, _SharedCounters(window_index, counts))
+        self._shared.move_to_end(key)
+        if len(self._shared) > self.max_users:
+            self._shared.popitem(last=False)
+        return shared
+
+    async def hit(self, key: int) -> float:
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.create_task(self._sync_loop())
+
+        now = time.time()
+        window_index = int(now // self.window)
+        shared = await self._get_shared(key, window_index)
+
+        # Время берем заново, если ждали чтения - окно могло смениться
+        now = time.time()
+        window_index = int(now // self.window)
+        shared.last_window = window_index
+        wait_time = sliding_window_wait(
+            self.rate_limit,
+            self.window,
+            now - window_index * self.window,
+            self._count(key, shared, window_index - 1),
+            self._count(key, shared, window_index)
+        )
+        if wait_time == 0:
+            counter_key = (key, window_index)
+            self._pending[counter_key] = self._pending.get(counter_key, 0) + 1
+        return wait_time
+
+    def _forget_inactive(self, current_window: int) -> None:
+        """Забыть пользователей, чьи окна больше не участвуют в оценке"""
+        # _shared упорядочен по последнему запросу - неактивные в начале
+        while self._shared:
+            key, shared = next(iter(self._shared.items()))
+            if shared.last_window >= current_window - 1:
+                break
+            del self._shared[key]
+
+    async def sync(self) -> None:
+        """Записать накопленные запросы и обновить снимки хранимых пользователей"""
+        current_window = int(time.time() // self.window)
+        pending, self._pending = self._pending, {}
+        self._flushing = pending
+
+        try:
+            if pending:
+                async with self.pool.writer() as db:
+                    await db.executemany("""
+                        INSERT INTO rate_limit_counters (scope, user_id, window_index, count)
+                        VALUES (?, ?, ?, ?)
+                        ON CONFLICT(scope, user_id, window_index) DO UPDATE SET
+                            count = count + excluded.count
+                    """, [
+                        (self.scope, user_id, window_index, count)
+                        for (user_id, window_index), count in pending.items()
+                    ])
+                    # Окна старше предыдущего больше не участвуют в оценке
+                    await db.execute("""
+                        DELETE FROM rate_limit_counters
+                        WHERE scope = ? AND window_index < ?
+                    """, (self.scope, current_window - 1))
+                    await db.commit()
+        except BaseException:
+            # Не потерять запросы: вернем их к несохраненным
+            for counter_key, count in pending.items():
+                self._pending[counter_key] = self._pending.get(counter_key, 0) + count
+            self._flushing = {}
+            raise
+
+        self._forget_inactive(current_window)
+        try:
+            fresh = await self._read(list(self._shared), current_window - 1)
+        except BaseException:
+            # Записанные запросы уже в БД - учитываем их в снимках до следующего чтения
+            for (user_id, window_index), count in pending.items():
+                shared = self._shared.get(user_id)
+                if shared is not None:
+                    shared.counts[window_index] = shared.counts.get(window_index, 0) + count
+            self._flushing = {}
+            raise
+
+        for key, counts in fresh.items():
+            shared = self._shared.get(key)
+            if shared is not None:
+                shared.counts = counts
+        self._flushing = {}
+
+    async def _sync_loop(self) -> None:
+        while True:
+            try:
+                await self.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка синхронизации rate limit ({self.scope}): {e}")
+            await asyncio.sleep(self.sync_interval)
+
+    async def close(self) -> None:
+        if self._sync_task and not self._sync_task.done():
+            self._sync_task.cancel()
+            try:
+                await self._sync_task
+            except asyncio.CancelledError:
+                pass
+        self._sync_task = None
+
+        if self._pending:
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.error(f"Не удалось сохранить счетчики rate limit ({self.scope}): {e}")
+
+
+def create_rate_limit_backend(scope: str, rate_limit: int, window_seconds: float) -> RateLimitBackend:
+    """Создать хранилище счетчиков по настройке RATE_LIMIT_BACKEND"""
+    if RATE_LIMIT_BACKEND == "sqlite":
+        return SQLiteRateLimitBackend(scope, rate_limit, window_seconds)
+    if RATE_LIMIT_BACKEND != "memory":
+        logger.warning(f"Неизвестный RATE_LIMIT_BACKEND '{RATE_LIMIT_BACKEND}', используется memory")
+    return MemoryRateLimitBackend(rate_limit, window_seconds)
 
 
 class RateLimitMiddleware(BaseMiddleware):
     """Middleware для ограничения частоты запросов"""
     
-    def __init__(self, rate_limit: int = 10, window_seconds: int = 60) -> None:
+    def __init__(
+        self,
+        rate_limit: int = 10,
+        window_seconds: int = 60,
+        scope: str = "default",
+        backend: Optional[RateLimitBackend] = None
+    ) -> None:
         """
         rate_limit: максимум запросов за период
         window_seconds: период в секундах
+        scope: имя набора счетчиков в общем хранилище
+        backend: хранилище счетчиков (по умолчанию - по RATE_LIMIT_BACKEND)
         """
         self.rate_limit = rate_limit
-        self.window = timedelta(seconds=window_seconds)
-        self.user_requests: Dict[int, list[datetime]] = {}
-        self.cleanup_task = None
-        self._start_cleanup_task()
+        self.backend = backend or create_rate_limit_backend(scope, rate_limit, window_seconds)
     
     async def __call__(
         self,
@@ -29,24 +351,9 @@ class RateLimitMiddleware(BaseMiddleware):
     ) -> Any:
         """Проверка rate limit перед обработкой события"""
         user_id = event.from_user.id
-        now = datetime.now()
         
-        # Получаем историю запросов пользователя
-        if user_id not in self.user_requests:
-            self.user_requests[user_id] = []
-        
-        # Удаляем старые запросы
-        self.user_requests[user_id] = [
-            req_time for req_time in self.user_requests[user_id]
-            if now - req_time < self.window
-        ]
-        
-        # Проверяем лимит
-        if len(self.user_requests[user_id]) >= self.rate_limit:
-            # Вычисляем, когда можно будет сделать следующий запрос
-            oldest_request = min(self.user_requests[user_id])
-            wait_time = (oldest_request + self.window - now).total_seconds()
-            
+        wait_time = await self.backend.hit(user_id)
+        if wait_time > 0:
             logger.warning(f"Rate limit для пользователя {user_id}: ждать {int(wait_time)} сек")
             
             # Тихо игнорируем запрос для CallbackQuery
@@ -55,48 +362,12 @@ class RateLimitMiddleware(BaseMiddleware):
             
             return
         
-        # Записываем новый запрос
-        self.user_requests[user_id].append(now)
-        
         # Передаем управление следующему обработчику
         return await handler(event, data)
     
-    def _start_cleanup_task(self) -> None:
-        """Запускает фоновую задачу очистки"""
-        self.cleanup_task = asyncio.create_task(self._cleanup_loop())
-    
-    async def _cleanup_loop(self) -> None:
-        """Периодически очищает неактивных пользователей"""
-        while True:
-            try:
-                await asyncio.sleep(self.window.total_seconds() * 2)  # Чистим каждые 2 окна
-                await self._cleanup_inactive_users()
-            except asyncio.CancelledError:
-                break
-            except Exception as e:
-                logger.error(f"Ошибка при очистке rate limiter: {e}")
-    
-    async def _cleanup_inactive_users(self) -> None:
-        """Удаляет пользователей без активных запросов"""
-        now = datetime.now()
-        users_to_remove = []
-        
-        for user_id, requests in self.user_requests.items():
-            # Фильтруем старые запросы
-            active_requests = [req for req in requests if now - req < self.window]
-            
-            # Если нет активных запросов, помечаем для удаления
-            if not active_requests:
-                users_to_remove.append(user_id)
-            else:
-                self.user_requests[user_id] = active_requests
-        
-        # Удаляем неактивных пользователей
-        for user_id in users_to_remove:
-            del self.user_requests[user_id]
-        
-        if users_to_remove:
-            logger.debug(f"Очищено {len(users_to_remove)} неактивных пользователей из rate limiter")
+    async def close(self) -> None:
+        """Сохранить счетчики при остановке бота"""
+        await self.backend.close()
 
 
 class GenerationRateLimitMiddleware(RateLimitMiddleware):
@@ -104,4 +375,4 @@ class GenerationRateLimitMiddleware(RateLimitMiddleware):
     
     def __init__(self) -> None:
         # 3 генерации в 5 минут
-        super().__init__(rate_limit=3, window_seconds=300)
\ No newline at end of file
+        super().__init__(rate_limit=3, window_seconds=300, scope="generation")
@@ -0,0 +1,104 @@
+"""
+Параллельная обработка обновлений разных пользователей с сохранением порядка для одного
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from ..config import logger, DISPATCH_WORKERS, DISPATCH_MAX_PENDING_PER_USER
+
+
+class _UserLane:
+    """Очередь обновлений одного пользователя"""
+
+    __slots__ = ("lock", "pending")
+
+    def __init__(self) -> None:
+        # asyncio.Lock будит ожидающих в порядке очереди - это и сохраняет порядок
+        self.lock = asyncio.Lock()
+        self.pending = 0
+
+
+class OrderedDispatchMiddleware(BaseMiddleware):
+    """Outer middleware для dp.update.
+
+    Обновления одного пользователя обрабатываются строго по очереди (переходы FSM
+    не перемешиваются), разных - параллельно, не больше workers одновременно.
+    Ожидающие своей очереди обновления слот не занимают, поэтому поток сообщений
+    от одного пользователя не задерживает остальных. Сверх max_pending_per_user
+    обновлений одного пользователя отбрасываются.
+    """
+
+    def __init__(
+        self,
+        workers: int = DISPATCH_WORKERS,
+        max_pending_per_user: int = DISPATCH_MAX_PENDING_PER_USER
+    ) -> None:
+        self.workers = max(1, workers)
+        self.max_pending_per_user = max(1, max_pending_per_user)
+        self._slots = asyncio.Semaphore(self.workers)
+        self._lanes: Dict[int, _UserLane] = {}
+        self.active = 0
+        self.dropped = 0
+
+    @staticmethod
+    def _lane_key(data: Dict[str, Any]) -> Optional[int]:
+        user = data.get("event_from_user")
+        if user is not None:
+            return user.id
+        chat = data.get("event_chat")
+        if chat is not None:
+            return chat.id
+        return None
+
+    async def _run(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        async with self._slots:
+            self.active += 1
+            try:
+                return await handler(event, data)
+            finally:
+                self.active -= 1
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        key = self._lane_key(data)
+        if key is None:
+            return await self._run(handler, event, data)
+
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _UserLane()
+        if lane.pending >= self.max_pending_per_user:
+            self.dropped += 1
+            logger.warning(f"Слишком много необработанных обновлений от {key}, update_id={event.update_id} отброшен")
+            return None
+
+        lane.pending += 1
+        try:
+            async with lane.lock:
+                return await self._run(handler, event, data)
+        finally:
+            lane.pending -= 1
+            if lane.pending == 0:
+                del self._lanes[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Состояние для мониторинга"""
+        return {
+            "active": self.active,
+            "users": len(self._lanes),
+            "pending": sum(lane.pending for lane in self._lanes.values()),
+            "dropped": self.dropped
+        }
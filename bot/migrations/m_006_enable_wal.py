@@ -0,0 +1,31 @@
+"""
+Миграция для перевода базы данных в режим WAL
+"""
+from bot.migrations.migration_system import Migration
+from bot.config import logger
+
+
+class EnableWAL(Migration):
+    """Перевод bot_data.db в режим журнала WAL"""
+
+    # journal_mode нельзя менять внутри транзакции
+    transactional = False
+
+    def __init__(self):
+        super().__init__(
+            version="006",
+            description="Перевод БД в режим журнала WAL"
+        )
+
+    async def up(self, db):
+        """Включить WAL - читатели больше не блокируются записью очереди"""
+        async with db.execute("PRAGMA journal_mode = WAL") as cursor:
+            row = await cursor.fetchone()
+
+        if not row or str(row[0]).lower() != "wal":
+            # Например, БД в памяти или файловая система без поддержки shared memory
+            logger.warning(f"Не удалось включить WAL, текущий режим: {row[0] if row else 'unknown'}")
+
+    async def down(self, db):
+        """Вернуть стандартный режим журнала"""
+        await db.execute("PRAGMA journal_mode = DELETE")
@@ -0,0 +1,25 @@
+"""
+Миграция для добавления worker_id в generation_queue
+"""
+from bot.migrations.migration_system import Migration
+
+
+class QueueWorkerId(Migration):
+    """Добавление идентификатора worker'а, забравшего задачу"""
+    
+    def __init__(self):
+        super().__init__(
+            version="007",
+            description="Добавление поля worker_id в generation_queue"
+        )
+    
+    async def up(self, db):
+        """Добавить поле worker_id"""
+        await db.execute("""
+            ALTER TABLE generation_queue 
+            ADD COLUMN worker_id TEXT
+        """)
+    
+    async def down(self, db):
+        """Удалить поле worker_id"""
+        await db.execute("ALTER TABLE generation_queue DROP COLUMN worker_id")
@@ -0,0 +1,32 @@
+"""
+Миграция для аренды (lease) задач очереди worker'ами
+"""
+from bot.migrations.migration_system import Migration
+
+
+class QueueLeases(Migration):
+    """Добавление срока аренды задачи для нескольких worker'ов"""
+    
+    def __init__(self):
+        super().__init__(
+            version="008",
+            description="Добавление поля lease_expires_at в generation_queue"
+        )
+    
+    async def up(self, db):
+        """Добавить поле lease_expires_at и индекс для поиска просроченных задач"""
+        await db.execute("""
+            ALTER TABLE generation_queue 
+            ADD COLUMN lease_expires_at TEXT
+        """)
+        
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_queue_processing_lease 
+            ON generation_queue(lease_expires_at)
+            WHERE status = 'processing'
+        """)
+    
+    async def down(self, db):
+        """Удалить поле lease_expires_at"""
+        await db.execute("DROP INDEX IF EXISTS idx_queue_processing_lease")
+        await db.execute("ALTER TABLE generation_queue DROP COLUMN lease_expires_at")
@@ -0,0 +1,25 @@
+"""
+Миграция для сохранения file_id результата генерации
+"""
+from bot.migrations.migration_system import Migration
+
+
+class QueueResultFileId(Migration):
+    """Добавление file_id отправленного результата в generation_queue"""
+    
+    def __init__(self):
+        super().__init__(
+            version="009",
+            description="Добавление поля result_file_id в generation_queue"
+        )
+    
+    async def up(self, db):
+        """Добавить поле result_file_id"""
+        await db.execute("""
+            ALTER TABLE generation_queue 
+            ADD COLUMN result_file_id TEXT
+        """)
+    
+    async def down(self, db):
+        """Удалить поле result_file_id"""
+        await db.execute("ALTER TABLE generation_queue DROP COLUMN result_file_id")
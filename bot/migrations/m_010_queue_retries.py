@@ -0,0 +1,32 @@
+"""
+Миграция для повторных попыток генерации
+"""
+from bot.migrations.migration_system import Migration
+
+
+class QueueRetries(Migration):
+    """Добавление счетчика попыток и времени следующей попытки в generation_queue"""
+    
+    def __init__(self):
+        super().__init__(
+            version="010",
+            description="Добавление полей attempts и not_before в generation_queue"
+        )
+    
+    async def up(self, db):
+        """Добавить поля attempts и not_before"""
+        await db.execute("""
+            ALTER TABLE generation_queue 
+            ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0
+        """)
+        
+        # Задача не берется из очереди раньше not_before (отложенный повтор)
+        await db.execute("""
+            ALTER TABLE generation_queue 
+            ADD COLUMN not_before TEXT
+        """)
+    
+    async def down(self, db):
+        """Удалить поля attempts и not_before"""
+        await db.execute("ALTER TABLE generation_queue DROP COLUMN not_before")
+        await db.execute("ALTER TABLE generation_queue DROP COLUMN attempts")
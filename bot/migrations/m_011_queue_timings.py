@@ -0,0 +1,25 @@
+"""
+Миграция для сохранения длительности этапов генерации
+"""
+from bot.migrations.migration_system import Migration
+
+
+class QueueTimings(Migration):
+    """Добавление длительности этапов обработки задачи в generation_queue"""
+    
+    def __init__(self):
+        super().__init__(
+            version="011",
+            description="Добавление поля timings в generation_queue"
+        )
+    
+    async def up(self, db):
+        """Добавить поле timings (JSON: этап -> секунды)"""
+        await db.execute("""
+            ALTER TABLE generation_queue 
+            ADD COLUMN timings TEXT
+        """)
+    
+    async def down(self, db):
+        """Удалить поле timings"""
+        await db.execute("ALTER TABLE generation_queue DROP COLUMN timings")
@@ -0,0 +1,36 @@
+"""
+Миграция для хранения состояний FSM в базе данных
+"""
+from bot.migrations.migration_system import Migration
+
+
+class FSMStorage(Migration):
+    """Создание таблицы состояний и данных FSM"""
+    
+    def __init__(self):
+        super().__init__(
+            version="012",
+            description="Создание таблицы fsm_storage"
+        )
+    
+    async def up(self, db):
+        """Создать таблицу fsm_storage"""
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS fsm_storage (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT NOT NULL DEFAULT '{}',
+                updated_at TEXT NOT NULL
+            )
+        """)
+        
+        # Индекс для удаления устаревших записей
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_fsm_storage_updated_at 
+            ON fsm_storage(updated_at)
+        """)
+    
+    async def down(self, db):
+        """Удалить таблицу fsm_storage"""
+        await db.execute("DROP INDEX IF EXISTS idx_fsm_storage_updated_at")
+        await db.execute("DROP TABLE IF EXISTS fsm_storage")
@@ -0,0 +1,37 @@
+"""
+Миграция для общих счетчиков rate limit нескольких экземпляров бота
+"""
+from bot.migrations.migration_system import Migration
+
+
+class RateLimitCounters(Migration):
+    """Создание таблицы счетчиков запросов пользователей по окнам"""
+    
+    def __init__(self):
+        super().__init__(
+            version="013",
+            description="Создание таблицы rate_limit_counters"
+        )
+    
+    async def up(self, db):
+        """Создать таблицу rate_limit_counters"""
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS rate_limit_counters (
+                scope TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                window_index INTEGER NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (scope, user_id, window_index)
+            )
+        """)
+        
+        # Индекс для чтения текущих окон и удаления старых
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_rate_limit_scope_window 
+            ON rate_limit_counters(scope, window_index)
+        """)
+    
+    async def down(self, db):
+        """Удалить таблицу rate_limit_counters"""
+        await db.execute("DROP INDEX IF EXISTS idx_rate_limit_scope_window")
+        await db.execute("DROP TABLE IF EXISTS rate_limit_counters")
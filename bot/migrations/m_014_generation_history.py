@@ -0,0 +1,41 @@
+"""
+Миграция для архива завершенных задач очереди
+"""
+from bot.migrations.migration_system import Migration
+
+
+class GenerationHistory(Migration):
+    """Создание компактной таблицы истории генераций"""
+    
+    def __init__(self):
+        super().__init__(
+            version="014",
+            description="Создание таблицы generation_history"
+        )
+    
+    async def up(self, db):
+        """Создать таблицу generation_history"""
+        # Только то, что нужно для статистики и разбора ошибок - без аренды и повторов
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS generation_history (
+                id INTEGER PRIMARY KEY,
+                session_id TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error_message TEXT,
+                created_at TEXT NOT NULL,
+                completed_at TEXT,
+                timings TEXT
+            )
+        """)
+        
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_history_user_id 
+            ON generation_history(user_id)
+        """)
+    
+    async def down(self, db):
+        """Удалить таблицу generation_history"""
+        await db.execute("DROP INDEX IF EXISTS idx_history_user_id")
+        await db.execute("DROP TABLE IF EXISTS generation_history")
@@ -0,0 +1,33 @@
+"""
+Миграция для перевода базы данных в режим auto_vacuum = INCREMENTAL
+"""
+from bot.migrations.migration_system import Migration
+from bot.config import logger
+
+
+class IncrementalVacuum(Migration):
+    """Перевод bot_data.db в режим инкрементальной очистки свободных страниц"""
+
+    # Смена auto_vacuum вступает в силу только после VACUUM, а он не работает в транзакции
+    transactional = False
+
+    def __init__(self):
+        super().__init__(
+            version="015",
+            description="Перевод БД в режим auto_vacuum = INCREMENTAL"
+        )
+
+    async def up(self, db):
+        """Включить INCREMENTAL - место после удаления старых задач возвращается пачками"""
+        await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        await db.execute("VACUUM")
+
+        async with db.execute("PRAGMA auto_vacuum") as cursor:
+            row = await cursor.fetchone()
+        if not row or row[0] != 2:
+            logger.warning(f"Не удалось включить auto_vacuum = INCREMENTAL, текущий режим: {row[0] if row else 'unknown'}")
+
+    async def down(self, db):
+        """Вернуть режим без автоматической очистки"""
+        await db.execute("PRAGMA auto_vacuum = NONE")
+        await db.execute("VACUUM")
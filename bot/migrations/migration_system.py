@@ -6,11 +6,15 @@ import importlib.util
 import inspect
 
 from ..config import logger
+from ..repositories.pool import open_connection
 
 
 class Migration:
     """Базовый класс для миграций"""
     
+    # Некоторые операции (смена journal_mode, VACUUM) нельзя выполнять внутри транзакции
+    transactional = True
+    
     def __init__(self, version: str, description: str):
         self.version = version
         self.description = description
@@ -33,7 +37,7 @@ class MigrationSystem:
     
     async def init_migrations_table(self):
         """Создать таблицу для отслеживания миграций"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with open_connection(self.db_path) as db:
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS migrations (
                     version TEXT PRIMARY KEY,
@@ -45,7 +49,7 @@ class MigrationSystem:
     
     async def get_applied_migrations(self) -> List[str]:
         """Получить список примененных миграций"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with open_connection(self.db_path) as db:
             async with db.execute("SELECT version FROM migrations ORDER BY version") as cursor:
                 return [row[0] for row in await cursor.fetchall()]
     
@@ -85,10 +89,11 @@ class MigrationSystem:
     
     async def apply_migration(self, version: str, migration: Migration):
         """Применить одну миграцию"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with open_connection(self.db_path) as db:
             try:
-                # Начинаем транзакцию
-                await db.execute("BEGIN")
+                if migration.transactional:
+                    # Начинаем транзакцию
+                    await db.execute("BEGIN")
                 
                 # Применяем миграцию
                 await migration.up(db)
@@ -153,9 +158,10 @@ class MigrationSystem:
         
         # Откатываем миграции
         for version, migration in to_rollback:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with open_connection(self.db_path) as db:
                 try:
-                    await db.execute("BEGIN")
+                    if migration.transactional:
+                        await db.execute("BEGIN")
                     
                     # Откатываем миграцию
                     await migration.down(db)
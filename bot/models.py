@@ -7,12 +7,25 @@ from datetime import datetime
 from pydantic import BaseModel, Field, validator, ConfigDict
 
 
+class InputImage(BaseModel):
+    """Входное изображение сессии"""
+    file_id: str = Field(..., min_length=1, description="file_id для скачивания из Telegram")
+    file_unique_id: Optional[str] = Field(None, description="Постоянный ID содержимого файла в Telegram")
+
+
 class SessionCreate(BaseModel):
     """Модель для создания новой сессии генерации"""
     user_id: int = Field(..., gt=0, description="ID пользователя Telegram")
-    images: List[str] = Field(default_factory=list, max_length=5, description="Список file_id изображений")
+    images: List[InputImage] = Field(default_factory=list, max_length=5, description="Список изображений")
     prompt: str = Field(..., min_length=3, max_length=4000, description="Текстовый промпт для генерации")
     
+    @validator('images', pre=True, each_item=True)
+    def parse_image(cls, v):
+        # Старый формат - только file_id
+        if isinstance(v, str):
+            return {'file_id': v}
+        return v
+    
     @validator('prompt')
     def clean_prompt(cls, v: str) -> str:
         return v.strip()
@@ -24,7 +37,7 @@ class Session(BaseModel):
     
     id: str = Field(..., description="UUID сессии")
     user_id: int = Field(..., gt=0)
-    images: List[str] = Field(default_factory=list)
+    images: List[InputImage] = Field(default_factory=list)
     prompt: str = Field(..., min_length=1)
     status: str = Field(..., pattern="^(pending|paid|completed|failed)$")
     payment_charge_id: Optional[str] = Field(None, description="ID платежа в Telegram")
@@ -7,7 +7,7 @@ class SessionRepository(ABC):
     """Абстрактный репозиторий для работы с сессиями"""
     
     @abstractmethod
-    async def create_session(self, user_id: int, images: List[str], prompt: str) -> str:
+    async def create_session(self, user_id: int, images: List[Dict[str, Any]], prompt: str) -> str:
         """Создать новую сессию"""
         pass
     
@@ -27,8 +27,8 @@ class SessionRepository(ABC):
         pass
     
     @abstractmethod
-    async def cleanup_expired_sessions(self, expire_minutes: int = 30) -> int:
-        """Очистить устаревшие сессии"""
+    async def cleanup_expired_sessions(self, expire_minutes: int = 30, limit: Optional[int] = None) -> int:
+        """Очистить устаревшие сессии (не больше limit за вызов)"""
         pass
 
 
@@ -106,8 +106,65 @@ class QueueRepository(ABC):
         pass
     
     @abstractmethod
-    async def update_queue_status(self, queue_id: int, status: str, error_message: Optional[str] = None) -> bool:
-        """Обновить статус задачи в очереди"""
+    async def claim_batch(
+        self,
+        limit: int,
+        worker_id: Optional[str] = None,
+        lease_seconds: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Атомарно забрать до limit задач из очереди и пометить их как processing"""
+        pass
+    
+    @abstractmethod
+    async def renew_leases(self, worker_id: str, queue_ids: List[int], lease_seconds: int) -> List[int]:
+        """Продлить аренду задач worker'а. Возвращает ID задач, аренда которых продлена"""
+        pass
+    
+    @abstractmethod
+    async def reclaim_expired_leases(self) -> int:
+        """Вернуть в очередь задачи с истекшей арендой"""
+        pass
+    
+    @abstractmethod
+    async def release_worker_items(self, worker_id: str) -> int:
+        """Вернуть в очередь незавершенные задачи worker'а"""
+        pass
+    
+    @abstractmethod
+    async def schedule_retry(
+        self,
+        queue_id: int,
+        delay_seconds: float,
+        error_message: Optional[str] = None,
+        worker_id: Optional[str] = None
+    ) -> bool:
+        """Вернуть задачу в очередь для повторной попытки не раньше чем через delay_seconds"""
+        pass
+    
+    @abstractmethod
+    async def update_queue_status(
+        self,
+        queue_id: int,
+        status: str,
+        error_message: Optional[str] = None,
+        worker_id: Optional[str] = None
+    ) -> bool:
+        """Обновить статус задачи в очереди. С worker_id - только если задача все еще у этого worker'а"""
+        pass
+    
+    @abstractmethod
+    async def set_result_file_id(self, queue_id: int, file_id: str, worker_id: Optional[str] = None) -> bool:
+        """Сохранить file_id отправленного результата"""
+        pass
+    
+    @abstractmethod
+    async def save_timings(
+        self,
+        queue_id: int,
+        timings: Dict[str, float],
+        worker_id: Optional[str] = None
+    ) -> bool:
+        """Сохранить длительность этапов обработки задачи. С worker_id - только если задача у этого worker'а"""
         pass
     
     @abstractmethod
@@ -115,17 +172,32 @@ class QueueRepository(ABC):
         """Получить позицию в очереди"""
         pass
     
+    @abstractmethod
+    async def get_queue_positions(self, session_ids: List[str]) -> Dict[str, int]:
+        """Получить позиции в очереди для нескольких сессий (отсутствующие в очереди не возвращаются)"""
+        pass
+    
     @abstractmethod
     async def get_pending_count(self) -> int:
         """Получить количество задач в очереди"""
         pass
     
+    @abstractmethod
+    async def get_last_delivered(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Получить последнюю доставленную задачу пользователя (с result_file_id)"""
+        pass
+    
     @abstractmethod
     async def get_user_queue_items(self, user_id: int) -> List[Dict[str, Any]]:
         """Получить задачи пользователя в очереди"""
         pass
     
     @abstractmethod
-    async def cleanup_stale_items(self, timeout_minutes: int = 30) -> int:
-        """Очистить зависшие задачи"""
+    async def cleanup_stale_items(self, timeout_minutes: int = 30, limit: Optional[int] = None) -> int:
+        """Очистить зависшие задачи (не больше limit за вызов)"""
+        pass
+    
+    @abstractmethod
+    async def archive_finished_items(self, older_than_days: int, limit: Optional[int] = None) -> int:
+        """Перенести завершенные задачи старше older_than_days в историю (не больше limit за вызов)"""
         pass
\ No newline at end of file
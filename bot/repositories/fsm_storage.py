@@ -0,0 +1,245 @@
+"""
+Хранилище состояний FSM в SQLite с кэшем в памяти и отложенной записью
+"""
+
+import asyncio
+import json
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Mapping, Optional, Set, Tuple
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+
+from ..config import logger, FSM_CACHE_MAX_ENTRIES, FSM_TTL_HOURS, FSM_FLUSH_INTERVAL
+from .pool import get_pool
+
+
+# Пустые данные FSM в сериализованном виде
+EMPTY_DATA = "{}"
+
+
+class _Record:
+    """Состояние и данные одного ключа FSM. Данные хранятся в JSON - это и копия, и компактность"""
+
+    __slots__ = ("state", "data", "updated_at")
+
+    def __init__(self, state: Optional[str], data: str, updated_at: datetime) -> None:
+        self.state = state
+        self.data = data
+        self.updated_at = updated_at
+
+    @property
+    def empty(self) -> bool:
+        return self.state is None and self.data == EMPTY_DATA
+
+
+class SQLiteFSMStorage(BaseStorage):
+    """FSM-хранилище в таблице fsm_storage.
+
+    Чтения обслуживаются из LRU-кэша (не больше max_entries ключей), изменения
+    пишутся в БД пачкой раз в flush_interval секунд. Записи, не менявшиеся
+    дольше ttl_hours, считаются пустыми и удаляются.
+    """
+
+    def __init__(
+        self,
+        db_path: str = "bot_data.db",
+        max_entries: int = FSM_CACHE_MAX_ENTRIES,
+        ttl_hours: int = FSM_TTL_HOURS,
+        flush_interval: int = FSM_FLUSH_INTERVAL
+    ) -> None:
+        self.pool = get_pool(db_path)
+        self.key_builder = DefaultKeyBuilder(
+            with_bot_id=True,
+            with_business_connection_id=True,
+            with_destiny=True
+        )
+        self.max_entries = max(1, max_entries)
+        self.ttl = timedelta(hours=ttl_hours) if ttl_hours > 0 else None
+        self.flush_interval = max(1, flush_interval)
+
+        self._cache: "OrderedDict[str, _Record]" = OrderedDict()
+        # Ключи, измененные после последней записи в БД. Из кэша не вытесняются
+        self._dirty: Set[str] = set()
+        # Ключи, записываемые текущим flush. Тоже не вытесняются до commit
+        self._flushing: Set[str] = set()
+        self._flush_lock = asyncio.Lock()
+        self._flush_wakeup = asyncio.Event()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._last_purge: Optional[datetime] = None
+
+    def _expired(self, record: _Record) -> bool:
+        return self.ttl is not None and datetime.now() - record.updated_at > self.ttl
+
+    async def _load(self, name: str) -> _Record:
+        async with self.pool.reader() as db:
+            async with db.execute(
+                "SELECT state, data, updated_at FROM fsm_storage WHERE key = ?", (name,)
+            ) as cursor:
+                row = await cursor.fetchone()
+        if row is None:
+            # Отсутствие записи тоже кэшируется - большинство апдейтов приходит без состояния
+            return _Record(None, EMPTY_DATA, datetime.now())
+        return _Record(row["state"], row["data"], datetime.fromisoformat(row["updated_at"]))
+
+    async def _get_record(self, key: StorageKey) -> Tuple[str, _Record]:
+        name = self.key_builder.build(key)
+        record = self._cache.get(name)
+        if record is None:
+            loaded = await self._load(name)
+            # Пока шло чтение, запись могла появиться в кэше
+            record = self._cache.setdefault(name, loaded)
+        self._cache.move_to_end(name)
+        self._evict(keep=name)
+
+        if not record.empty and self._expired(record):
+            record.state = None
+            record.data = EMPTY_DATA
+            self._touch(name, record)
+        return name, record
+
+    def _touch(self, name: str, record: _Record) -> None:
+        record.updated_at = datetime.now()
+        self._dirty.add(name)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """Вытеснить давно не использованные ключи, уже записанные в БД"""
+        overflow = len(self._cache) - self.max_entries
+        if overflow <= 0:
+            return
+
+        evicted = []
+        for name in self._cache:
+            if name not in self._dirty and name not in self._flushing and name != keep:
+                evicted.append(name)
+                if len(evicted) == overflow:
+                    break
+        for name in evicted:
+            del self._cache[name]
+
+        if len(evicted) < overflow:
+            # Кэш заполнен измененными ключами - записываем их, не дожидаясь интервала
+            self._flush_wakeup.set()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        name, record = await self._get_record(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._touch(name, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        _, record = await self._get_record(key)
+        return record.state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(
+                f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            )
+        name, record = await self._get_record(key)
+        record.data = json.dumps(data, ensure_ascii=False)
+        self._touch(name, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, record = await self._get_record(key)
+        return json.loads(record.data)
+
+    async def flush(self) -> int:
+        """Записать измененные ключи в БД одной транзакцией"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return 0
+
+            names = list(self._dirty)
+            # Изменения во время записи снова попадут в _dirty
+            self._dirty.clear()
+            self._flushing.update(names)
+
+            upserts = []
+            deletes = []
+            for name in names:
+                record = self._cache.get(name)
+                if record is None:
+                    continue
+                if record.empty:
+                    deletes.append((name,))
+                else:
+                    upserts.append((name, record.state, record.data, record.updated_at.isoformat()))
+
+            try:
+                async with self.pool.writer() as db:
+                    if upserts:
+                        await db.executemany("""
+                            INSERT INTO fsm_storage (key, state, data, updated_at)
+                            VALUES (?, ?, ?, ?)
+                            ON CONFLICT(key) DO UPDATE SET
+                                state = excluded.state,
+                                data = excluded.data,
+                                updated_at = excluded.updated_at
+                        """, upserts)
+                    if deletes:
+                        await db.executemany("DELETE FROM fsm_storage WHERE key = ?", deletes)
+                    await db.commit()
+            except BaseException:
+                # Повторим при следующей записи (в том числе после отмены)
+                self._dirty.update(names)
+                raise
+            finally:
+                self._flushing.clear()
+
+            return len(names)
+
+    async def purge_expired(self) -> int:
+        """Удалить из БД записи старше TTL"""
+        if self.ttl is None:
+            return 0
+
+        cutoff = (datetime.now() - self.ttl).isoformat()
+        async with self.pool.writer() as db:
+            cursor = await db.execute("DELETE FROM fsm_storage WHERE updated_at < ?", (cutoff,))
+            await db.commit()
+            deleted = cursor.rowcount
+
+        if deleted > 0:
+            logger.info(f"Удалено устаревших состояний FSM: {deleted}")
+        return deleted
+
+    async def _flush_loop(self) -> None:
+        """Фоновая запись изменений и очистка устаревших записей"""
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_wakeup.clear()
+
+            try:
+                await self.flush()
+                self._evict()
+
+                now = datetime.now()
+                if self._last_purge is None or now - self._last_purge > timedelta(hours=1):
+                    self._last_purge = now
+                    await self.purge_expired()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка записи состояний FSM: {e}")
+
+    async def close(self) -> None:
+        """Остановить фоновую запись и сохранить оставшиеся изменения"""
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+        self._flush_task = None
+
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Не удалось сохранить состояния FSM при остановке: {e}")
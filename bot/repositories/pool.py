@@ -0,0 +1,207 @@
+import asyncio
+import aiosqlite
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from ..config import logger, DB_READ_POOL_SIZE, DB_PRAGMA_PROFILE
+
+
+# Профили PRAGMA, применяемые к каждому соединению с БД.
+# durable - полный fsync на каждый коммит (платежи и балансы не теряются при сбое питания),
+# fast - fsync только на checkpoint WAL, больше кэш и mmap.
+PRAGMA_PROFILES: Dict[str, List[Tuple[str, str]]] = {
+    "durable": [
+        ("journal_mode", "WAL"),
+        ("synchronous", "FULL"),
+        ("busy_timeout", "5000"),
+        ("cache_size", "-8000"),  # 8MB
+        ("mmap_size", "0"),
+        ("temp_store", "MEMORY"),
+    ],
+    "fast": [
+        ("journal_mode", "WAL"),
+        ("synchronous", "NORMAL"),
+        ("busy_timeout", "5000"),
+        ("cache_size", "-64000"),  # 64MB
+        ("mmap_size", "268435456"),  # 256MB
+        ("temp_store", "MEMORY"),
+    ],
+}
+
+
+def get_pragma_profile(name: str = DB_PRAGMA_PROFILE) -> List[Tuple[str, str]]:
+    """Получить список PRAGMA для профиля"""
+    profile = PRAGMA_PROFILES.get(name)
+    if profile is None:
+        logger.warning(f"Неизвестный профиль PRAGMA '{name}', используется 'durable'")
+        profile = PRAGMA_PROFILES["durable"]
+    return profile
+
+
+async def apply_pragmas(conn: aiosqlite.Connection, profile: str = DB_PRAGMA_PROFILE) -> None:
+    """Применить профиль PRAGMA к соединению"""
+    for pragma, value in get_pragma_profile(profile):
+        # Имена и значения берутся только из PRAGMA_PROFILES
+        await conn.execute(f"PRAGMA {pragma} = {value}")
+
+
+async def connect(db_path: str, profile: str = DB_PRAGMA_PROFILE) -> aiosqlite.Connection:
+    """Открыть соединение с БД с примененным профилем PRAGMA"""
+    conn = await aiosqlite.connect(db_path)
+    try:
+        await apply_pragmas(conn, profile)
+    except Exception:
+        await conn.close()
+        raise
+    return conn
+
+
+@asynccontextmanager
+async def open_connection(db_path: str, profile: str = DB_PRAGMA_PROFILE) -> AsyncIterator[aiosqlite.Connection]:
+    """Отдельное соединение вне пула (миграции, начальная инициализация)"""
+    conn = await connect(db_path, profile)
+    try:
+        yield conn
+    finally:
+        await conn.close()
+
+
+class SQLiteConnectionPool:
+    """Пул соединений aiosqlite: одно соединение на запись и несколько на чтение"""
+
+    def __init__(self, db_path: str = "bot_data.db", read_pool_size: int = DB_READ_POOL_SIZE) -> None:
+        self.db_path = db_path
+        self.read_pool_size = max(1, read_pool_size)
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
+        self._readers: List[aiosqlite.Connection] = []
+        self._free_readers: Optional[asyncio.Queue] = None
+        self._open_lock = asyncio.Lock()
+        self._closed = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._writer is not None
+
+    async def _connect(self) -> aiosqlite.Connection:
+        """Открыть новое соединение с БД"""
+        conn = await connect(self.db_path)
+        conn.row_factory = aiosqlite.Row
+        return conn
+
+    async def open(self) -> None:
+        """Открыть соединения пула (повторный вызов ничего не делает)"""
+        async with self._open_lock:
+            if self._writer is not None:
+                return
+
+            self._closed = False
+            self._writer = await self._connect()
+            self._free_readers = asyncio.Queue()
+            for _ in range(self.read_pool_size):
+                conn = await self._connect()
+                self._readers.append(conn)
+                self._free_readers.put_nowait(conn)
+
+            logger.info(
+                f"Пул соединений открыт: {self.db_path} "
+                f"(1 на запись, {self.read_pool_size} на чтение)"
+            )
+
+    async def close(self) -> None:
+        """Закрыть все соединения пула"""
+        async with self._open_lock:
+            if self._writer is None:
+                return
+
+            self._closed = True
+            # Дожидаемся завершения текущей записи
+            async with self._write_lock:
+                await self._writer.close()
+                self._writer = None
+
+            for conn in self._readers:
+                await conn.close()
+            self._readers.clear()
+            self._free_readers = None
+
+            logger.info(f"Пул соединений закрыт: {self.db_path}")
+
+    async def _ensure_open(self) -> None:
+        if self._closed:
+            raise RuntimeError("Пул соединений закрыт")
+        if self._writer is None:
+            await self.open()
+
+    @asynccontextmanager
+    async def writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Эксклюзивный доступ к соединению на запись.
+
+        Незакоммиченная транзакция откатывается при выходе из блока,
+        чтобы следующий пользователь соединения получил его в чистом виде.
+        """
+        await self._ensure_open()
+        async with self._write_lock:
+            conn = self._writer
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    await conn.rollback()
+
+    async def incremental_vacuum(self, max_pages: int) -> int:
+        """Вернуть ОС до max_pages свободных страниц (нужен auto_vacuum = INCREMENTAL).
+
+        Возвращает количество освобожденных страниц.
+        """
+        async with self.writer() as conn:
+            async with conn.execute("PRAGMA freelist_count") as cursor:
+                before = (await cursor.fetchone())[0]
+            if not before:
+                return 0
+
+            # Прагма освобождает по странице на каждый шаг, а execute делает только
+            # первый - executescript выполняет ее до конца
+            await conn.executescript(f"PRAGMA incremental_vacuum({int(max_pages)});")
+
+            async with conn.execute("PRAGMA freelist_count") as cursor:
+                after = (await cursor.fetchone())[0]
+            return before - after
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Взять соединение на чтение из пула"""
+        await self._ensure_open()
+        free_readers = self._free_readers
+        conn = await free_readers.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                await conn.rollback()
+            free_readers.put_nowait(conn)
+
+
+# Пулы по пути к БД - все репозитории одной БД разделяют один пул
+_pools: Dict[str, SQLiteConnectionPool] = {}
+
+
+def get_pool(db_path: str = "bot_data.db") -> SQLiteConnectionPool:
+    """Получить общий пул соединений для указанной БД"""
+    pool = _pools.get(db_path)
+    if pool is None:
+        pool = SQLiteConnectionPool(db_path)
+        _pools[db_path] = pool
+    return pool
+
+
+async def open_pools() -> None:
+    """Открыть все зарегистрированные пулы"""
+    for pool in list(_pools.values()):
+        await pool.open()
+
+
+async def close_pools() -> None:
+    """Закрыть все пулы (для graceful shutdown)"""
+    for pool in list(_pools.values()):
+        await pool.close()
@@ -1,11 +1,11 @@
-import aiosqlite
 import secrets
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Tuple
 from datetime import datetime, timedelta
 from pathlib import Path
 import json
 
 from .base import SessionRepository, PaymentRepository, BalanceRepository, QueueRepository
+from .pool import get_pool, open_connection
 from ..config import logger
 
 
@@ -14,12 +14,13 @@ class SQLiteSessionRepository(SessionRepository):
     
     def __init__(self, db_path: str = "bot_data.db") -> None:
         self.db_path = db_path
+        self.pool = get_pool(db_path)
     
-    async def create_session(self, user_id: int, images: List[str], prompt: str) -> str:
+    async def create_session(self, user_id: int, images: List[Dict[str, Any]], prompt: str) -> str:
         """Создать новую сессию"""
         session_id = secrets.token_urlsafe(32)
         
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.writer() as db:
             await db.execute("""
                 INSERT INTO sessions (id, user_id, images, prompt, status, created_at)
                 VALUES (?, ?, ?, ?, ?, ?)
@@ -37,8 +38,7 @@ class SQLiteSessionRepository(SessionRepository):
     
     async def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
         """Получить сессию по ID"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.pool.reader() as db:
             async with db.execute(
                 "SELECT * FROM sessions WHERE id = ?", (session_id,)
             ) as cursor:
@@ -74,27 +74,32 @@ class SQLiteSessionRepository(SessionRepository):
         values.append(session_id)
         query = f"UPDATE sessions SET {', '.join(updates)} WHERE id = ?"
         
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.writer() as db:
             await db.execute(query, values)
             await db.commit()
             return True
     
     async def delete_session(self, session_id: str) -> bool:
         """Удалить сессию"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.writer() as db:
             await db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
             await db.commit()
             return True
     
-    async def cleanup_expired_sessions(self, expire_minutes: int = 30) -> int:
-        """Очистить устаревшие сессии"""
+    async def cleanup_expired_sessions(self, expire_minutes: int = 30, limit: Optional[int] = None) -> int:
+        """Очистить устаревшие сессии (не больше limit за вызов)"""
         expire_time = (datetime.now() - timedelta(minutes=expire_minutes)).isoformat()
         
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.writer() as db:
+            # Ограниченная пачка по индексу created_at не держит блокировку записи долго
             cursor = await db.execute("""
                 DELETE FROM sessions 
-                WHERE created_at < ? AND status = 'pending'
-            """, (expire_time,))
+                WHERE rowid IN (
+                    SELECT rowid FROM sessions
+                    WHERE created_at < ? AND status = 'pending'
+                    LIMIT ?
+                )
+            """, (expire_time, limit if limit else -1))
             await db.commit()
             return cursor.rowcount
 
@@ -104,6 +109,7 @@ class SQLitePaymentRepository(PaymentRepository):
     
     def __init__(self, db_path: str = "bot_data.db") -> None:
         self.db_path = db_path
+        self.pool = get_pool(db_path)
     
     async def save_payment(
         self, 
@@ -114,7 +120,7 @@ class SQLitePaymentRepository(PaymentRepository):
         status: str = "completed"
     ) -> int:
         """Сохранить информацию о платеже"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.writer() as db:
             cursor = await db.execute("""
                 INSERT INTO payments (session_id, user_id, payment_charge_id, amount, status, created_at)
                 VALUES (?, ?, ?, ?, ?, ?)
@@ -131,8 +137,7 @@ class SQLitePaymentRepository(PaymentRepository):
     
     async def get_payment(self, payment_id: int) -> Optional[Dict[str, Any]]:
         """Получить платеж по ID"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.pool.reader() as db:
             async with db.execute(
                 "SELECT * FROM payments WHERE id = ?", (payment_id,)
             ) as cursor:
@@ -143,8 +148,7 @@ class SQLitePaymentRepository(PaymentRepository):
     
     async def get_payment_by_charge_id(self, payment_charge_id: str) -> Optional[Dict[str, Any]]:
         """Получить платеж по charge ID"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.pool.reader() as db:
             async with db.execute(
                 "SELECT * FROM payments WHERE payment_charge_id = ?", (payment_charge_id,)
             ) as cursor:
@@ -155,7 +159,7 @@ class SQLitePaymentRepository(PaymentRepository):
     
     async def update_payment_status(self, payment_id: int, status: str) -> bool:
         """Обновить статус платежа"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.writer() as db:
             await db.execute(
                 "UPDATE payments SET status = ? WHERE id = ?",
                 (status, payment_id)
@@ -165,8 +169,7 @@ class SQLitePaymentRepository(PaymentRepository):
     
     async def get_user_payments(self, user_id: int, limit: int = 10) -> List[Dict[str, Any]]:
         """Получить платежи пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.pool.reader() as db:
             async with db.execute("""
                 SELECT * FROM payments 
                 WHERE user_id = ? 
@@ -182,11 +185,11 @@ class SQLiteBalanceRepository(BalanceRepository):
     
     def __init__(self, db_path: str = "bot_data.db") -> None:
         self.db_path = db_path
+        self.pool = get_pool(db_path)
     
     async def get_balance(self, user_id: int) -> int:
         """Получить баланс пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.pool.reader() as db:
             async with db.execute(
                 "SELECT balance FROM user_balances WHERE user_id = ?", (user_id,)
             ) as cursor:
@@ -197,7 +200,7 @@ class SQLiteBalanceRepository(BalanceRepository):
     
     async def add_balance(self, user_id: int, amount: int) -> int:
         """Добавить к балансу пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.writer() as db:
             # Сначала пытаемся обновить существующий баланс
             cursor = await db.execute("""
                 UPDATE user_balances 
@@ -223,7 +226,7 @@ class SQLiteBalanceRepository(BalanceRepository):
     
     async def deduct_balance(self, user_id: int, amount: int) -> bool:
         """Списать с баланса пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.writer() as db:
             # Проверяем текущий баланс
             async with db.execute(
                 "SELECT balance FROM user_balances WHERE user_id = ?", (user_id,)
@@ -244,7 +247,7 @@ class SQLiteBalanceRepository(BalanceRepository):
     
     async def create_or_get_balance(self, user_id: int) -> int:
         """Создать баланс если не существует или вернуть существующий"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.writer() as db:
             # Проверяем существующий баланс
             async with db.execute(
                 "SELECT balance FROM user_balances WHERE user_id = ?", (user_id,)
@@ -263,15 +266,23 @@ class SQLiteBalanceRepository(BalanceRepository):
             return 0
 
 
+def _owner_filter(worker_id: Optional[str]) -> Tuple[str, Tuple[str, ...]]:
+    """Условие "задача все еще арендована этим worker'ом" для UPDATE очереди"""
+    if worker_id is None:
+        return "", ()
+    return " AND worker_id = ?", (worker_id,)
+
+
 class SQLiteQueueRepository(QueueRepository):
     """SQLite реализация репозитория очереди генераций"""
     
     def __init__(self, db_path: str = "bot_data.db") -> None:
         self.db_path = db_path
+        self.pool = get_pool(db_path)
     
     async def add_to_queue(self, session_id: str, user_id: int, priority: int = 0) -> int:
         """Добавить задачу в очередь"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.writer() as db:
             cursor = await db.execute("""
                 INSERT INTO generation_queue (session_id, user_id, priority, status, created_at)
                 VALUES (?, ?, ?, 'pending', ?)
@@ -281,94 +292,222 @@ class SQLiteQueueRepository(QueueRepository):
     
     async def get_next_in_queue(self) -> Optional[Dict[str, Any]]:
         """Получить следующую задачу из очереди"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            # Атомарно получаем и блокируем следующий элемент
-            await db.execute("BEGIN IMMEDIATE")
-            try:
-                async with db.execute("""
-                    SELECT id, session_id, user_id, priority, created_at 
-                    FROM generation_queue 
-                    WHERE status = 'pending'
+        items = await self.claim_batch(1)
+        return items[0] if items else None
+    
+    async def claim_batch(
+        self,
+        limit: int,
+        worker_id: Optional[str] = None,
+        lease_seconds: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Атомарно забрать до limit задач из очереди и пометить их как processing"""
+        if limit <= 0:
+            return []
+        
+        now = datetime.now()
+        lease_expires_at = (
+            (now + timedelta(seconds=lease_seconds)).isoformat()
+            if lease_seconds else None
+        )
+        
+        async with self.pool.writer() as db:
+            # Один UPDATE ... RETURNING - выбор и блокировка задач в одной транзакции
+            async with db.execute("""
+                UPDATE generation_queue 
+                SET status = 'processing', started_at = ?, worker_id = ?, lease_expires_at = ?,
+                    attempts = attempts + 1
+                WHERE id IN (
+                    SELECT id FROM generation_queue 
+                    WHERE status = 'pending' AND (not_before IS NULL OR not_before <= ?)
                     ORDER BY priority DESC, created_at ASC
-                    LIMIT 1
-                """) as cursor:
-                    row = await cursor.fetchone()
-                    
-                if row:
-                    # Сразу помечаем как processing чтобы другие процессы не взяли
-                    await db.execute("""
-                        UPDATE generation_queue 
-                        SET status = 'processing', started_at = ?
-                        WHERE id = ? AND status = 'pending'
-                    """, (datetime.now().isoformat(), row['id']))
-                    
-                    if db.total_changes > 0:
-                        await db.commit()
-                        return dict(row)
-                    
-                await db.rollback()
-                return None
-                
-            except Exception:
-                await db.rollback()
-                raise
-    
-    async def update_queue_status(self, queue_id: int, status: str, error_message: Optional[str] = None) -> bool:
-        """Обновить статус задачи в очереди"""
-        async with aiosqlite.connect(self.db_path) as db:
+                    LIMIT ?
+                )
+                RETURNING id, session_id, user_id, priority, created_at, result_file_id, attempts
+            """, (now.isoformat(), worker_id, lease_expires_at, now.isoformat(), limit)) as cursor:
+                rows = await cursor.fetchall()
+            await db.commit()
+        
+        # RETURNING не гарантирует порядок строк
+        items = [dict(row) for row in rows]
+        items.sort(key=lambda item: (-item['priority'], item['created_at']))
+        return items
+    
+    async def renew_leases(self, worker_id: str, queue_ids: List[int], lease_seconds: int) -> List[int]:
+        """Продлить аренду задач worker'а. Возвращает ID задач, аренда которых продлена"""
+        if not queue_ids:
+            return []
+        
+        lease_expires_at = (datetime.now() + timedelta(seconds=lease_seconds)).isoformat()
+        placeholders = ", ".join("?" for _ in queue_ids)
+        
+        async with self.pool.writer() as db:
+            async with db.execute(f"""
+                UPDATE generation_queue 
+                SET lease_expires_at = ?
+                WHERE worker_id = ? AND status = 'processing' AND id IN ({placeholders})
+                RETURNING id
+            """, (lease_expires_at, worker_id, *queue_ids)) as cursor:
+                rows = await cursor.fetchall()
+            await db.commit()
+            return [row[0] for row in rows]
+    
+    async def reclaim_expired_leases(self) -> int:
+        """Вернуть в очередь задачи с истекшей арендой"""
+        async with self.pool.writer() as db:
+            cursor = await db.execute("""
+                UPDATE generation_queue 
+                SET status = 'pending', worker_id = NULL, lease_expires_at = NULL, started_at = NULL
+                WHERE status = 'processing' AND lease_expires_at < ?
+            """, (datetime.now().isoformat(),))
+            await db.commit()
+            return cursor.rowcount
+    
+    async def release_worker_items(self, worker_id: str) -> int:
+        """Вернуть в очередь незавершенные задачи worker'а"""
+        async with self.pool.writer() as db:
+            # Прерванная остановкой worker'а попытка не считается
+            cursor = await db.execute("""
+                UPDATE generation_queue 
+                SET status = 'pending', worker_id = NULL, lease_expires_at = NULL, started_at = NULL,
+                    attempts = MAX(attempts - 1, 0)
+                WHERE status = 'processing' AND worker_id = ?
+            """, (worker_id,))
+            await db.commit()
+            return cursor.rowcount
+    
+    async def schedule_retry(
+        self,
+        queue_id: int,
+        delay_seconds: float,
+        error_message: Optional[str] = None,
+        worker_id: Optional[str] = None
+    ) -> bool:
+        """Вернуть задачу в очередь для повторной попытки не раньше чем через delay_seconds"""
+        not_before = (datetime.now() + timedelta(seconds=delay_seconds)).isoformat()
+        owner_clause, owner_params = _owner_filter(worker_id)
+        
+        async with self.pool.writer() as db:
+            cursor = await db.execute(f"""
+                UPDATE generation_queue 
+                SET status = 'pending', not_before = ?, error_message = ?,
+                    worker_id = NULL, lease_expires_at = NULL, started_at = NULL
+                WHERE id = ? AND status = 'processing'{owner_clause}
+            """, (not_before, error_message, queue_id, *owner_params))
+            await db.commit()
+            return cursor.rowcount > 0
+    
+    async def update_queue_status(
+        self,
+        queue_id: int,
+        status: str,
+        error_message: Optional[str] = None,
+        worker_id: Optional[str] = None
+    ) -> bool:
+        """Обновить статус задачи в очереди. С worker_id - только если задача все еще у этого worker'а"""
+        owner_clause, owner_params = _owner_filter(worker_id)
+        
+        async with self.pool.writer() as db:
             if status == 'processing':
-                await db.execute("""
+                cursor = await db.execute(f"""
                     UPDATE generation_queue 
                     SET status = ?, started_at = ?
-                    WHERE id = ?
-                """, (status, datetime.now().isoformat(), queue_id))
+                    WHERE id = ?{owner_clause}
+                """, (status, datetime.now().isoformat(), queue_id, *owner_params))
             elif status == 'completed':
-                await db.execute("""
+                cursor = await db.execute(f"""
                     UPDATE generation_queue 
                     SET status = ?, completed_at = ?
-                    WHERE id = ?
-                """, (status, datetime.now().isoformat(), queue_id))
+                    WHERE id = ?{owner_clause}
+                """, (status, datetime.now().isoformat(), queue_id, *owner_params))
             elif status == 'failed':
-                await db.execute("""
+                cursor = await db.execute(f"""
                     UPDATE generation_queue 
                     SET status = ?, error_message = ?, completed_at = ?
-                    WHERE id = ?
-                """, (status, error_message, datetime.now().isoformat(), queue_id))
+                    WHERE id = ?{owner_clause}
+                """, (status, error_message, datetime.now().isoformat(), queue_id, *owner_params))
             else:
-                await db.execute("""
+                cursor = await db.execute(f"""
                     UPDATE generation_queue 
                     SET status = ?
-                    WHERE id = ?
-                """, (status, queue_id))
+                    WHERE id = ?{owner_clause}
+                """, (status, queue_id, *owner_params))
             await db.commit()
-            return True
+            return cursor.rowcount > 0
+    
+    async def set_result_file_id(self, queue_id: int, file_id: str, worker_id: Optional[str] = None) -> bool:
+        """Сохранить file_id отправленного результата"""
+        owner_clause, owner_params = _owner_filter(worker_id)
+        
+        async with self.pool.writer() as db:
+            cursor = await db.execute(f"""
+                UPDATE generation_queue 
+                SET result_file_id = ?
+                WHERE id = ?{owner_clause}
+            """, (file_id, queue_id, *owner_params))
+            await db.commit()
+            return cursor.rowcount > 0
+    
+    async def save_timings(
+        self,
+        queue_id: int,
+        timings: Dict[str, float],
+        worker_id: Optional[str] = None
+    ) -> bool:
+        """Сохранить длительность этапов обработки задачи. С worker_id - только если задача у этого worker'а"""
+        owner_clause, owner_params = _owner_filter(worker_id)
+        
+        async with self.pool.writer() as db:
+            cursor = await db.execute(f"""
+                UPDATE generation_queue 
+                SET timings = ?
+                WHERE id = ?{owner_clause}
+            """, (json.dumps(timings), queue_id, *owner_params))
+            await db.commit()
+            return cursor.rowcount > 0
     
     async def get_queue_position(self, session_id: str) -> Optional[int]:
         """Получить позицию в очереди"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Используем оконную функцию для эффективного подсчета позиции
-            async with db.execute("""
-                WITH queue_positions AS (
-                    SELECT 
-                        session_id,
-                        ROW_NUMBER() OVER (
-                            ORDER BY priority DESC, created_at ASC
-                        ) as position
-                    FROM generation_queue
-                    WHERE status = 'pending'
-                )
-                SELECT position FROM queue_positions
-                WHERE session_id = ?
-            """, (session_id,)) as cursor:
-                row = await cursor.fetchone()
-                if row:
-                    return row[0]
-        return None
+        positions = await self.get_queue_positions([session_id])
+        return positions.get(session_id)
+    
+    async def get_queue_positions(self, session_ids: List[str]) -> Dict[str, int]:
+        """Получить позиции в очереди для нескольких сессий одним запросом.
+        
+        Задачи, отложенные для повтора (not_before в будущем), worker не берет:
+        они не считаются впереди других и сами позиции не получают.
+        """
+        if not session_ids:
+            return {}
+        
+        now = datetime.now().isoformat()
+        placeholders = ", ".join("?" for _ in session_ids)
+        async with self.pool.reader() as db:
+            # Позиция = 1 + задачи впереди. Оба подсчета - диапазоны частичного индекса
+            # idx_queue_pending_priority_created, без сортировки всей очереди
+            async with db.execute(f"""
+                SELECT 
+                    t.session_id,
+                    1 + (
+                        SELECT COUNT(*) FROM generation_queue AS q
+                        WHERE q.status = 'pending' AND q.priority > t.priority
+                          AND (q.not_before IS NULL OR q.not_before <= ?)
+                    ) + (
+                        SELECT COUNT(*) FROM generation_queue AS q
+                        WHERE q.status = 'pending' AND q.priority = t.priority
+                          AND q.created_at < t.created_at
+                          AND (q.not_before IS NULL OR q.not_before <= ?)
+                    ) AS position
+                FROM generation_queue AS t
+                WHERE t.session_id IN ({placeholders}) AND t.status = 'pending'
+                  AND (t.not_before IS NULL OR t.not_before <= ?)
+            """, (now, now, *session_ids, now)) as cursor:
+                rows = await cursor.fetchall()
+                return {row[0]: row[1] for row in rows}
     
     async def get_pending_count(self) -> int:
         """Получить количество задач в очереди"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.reader() as db:
             async with db.execute("""
                 SELECT COUNT(*) FROM generation_queue 
                 WHERE status = 'pending'
@@ -376,10 +515,23 @@ class SQLiteQueueRepository(QueueRepository):
                 row = await cursor.fetchone()
                 return row[0] if row else 0
     
+    async def get_last_delivered(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Получить последнюю доставленную задачу пользователя (с result_file_id)"""
+        async with self.pool.reader() as db:
+            async with db.execute("""
+                SELECT id, result_file_id FROM generation_queue
+                WHERE user_id = ? AND result_file_id IS NOT NULL
+                ORDER BY id DESC
+                LIMIT 1
+            """, (user_id,)) as cursor:
+                row = await cursor.fetchone()
+                if row:
+                    return dict(row)
+        return None
+    
     async def get_user_queue_items(self, user_id: int) -> List[Dict[str, Any]]:
         """Получить задачи пользователя в очереди"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.pool.reader() as db:
             async with db.execute("""
                 SELECT * FROM generation_queue 
                 WHERE user_id = ? AND status IN ('pending', 'processing')
@@ -388,23 +540,63 @@ class SQLiteQueueRepository(QueueRepository):
                 rows = await cursor.fetchall()
                 return [dict(row) for row in rows]
     
-    async def cleanup_stale_items(self, timeout_minutes: int = 30) -> int:
-        """Очистить зависшие задачи"""
+    async def cleanup_stale_items(self, timeout_minutes: int = 30, limit: Optional[int] = None) -> int:
+        """Очистить зависшие задачи (не больше limit за вызов)"""
         timeout_time = (datetime.now() - timedelta(minutes=timeout_minutes)).isoformat()
         
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.writer() as db:
+            # Задачи с арендой возвращаются в очередь через reclaim_expired_leases,
+            # здесь остаются только записи, взятые до появления аренды
             cursor = await db.execute("""
                 UPDATE generation_queue 
                 SET status = 'failed', error_message = 'Timeout', completed_at = ?
-                WHERE status = 'processing' AND started_at < ?
-            """, (datetime.now().isoformat(), timeout_time))
+                WHERE id IN (
+                    SELECT id FROM generation_queue
+                    WHERE status = 'processing' AND lease_expires_at IS NULL AND started_at < ?
+                    LIMIT ?
+                )
+            """, (datetime.now().isoformat(), timeout_time, limit if limit else -1))
+            await db.commit()
+            return cursor.rowcount
+    
+    async def archive_finished_items(self, older_than_days: int, limit: Optional[int] = None) -> int:
+        """Перенести завершенные задачи старше older_than_days в историю (не больше limit за вызов)"""
+        cutoff = (datetime.now() - timedelta(days=older_than_days)).isoformat()
+        
+        async with self.pool.writer() as db:
+            # Условие совпадает с частичным индексом idx_queue_completed_at
+            async with db.execute("""
+                SELECT id FROM generation_queue
+                WHERE status IN ('completed', 'failed') AND completed_at < ?
+                ORDER BY completed_at
+                LIMIT ?
+            """, (cutoff, limit if limit else -1)) as cursor:
+                queue_ids = [row[0] for row in await cursor.fetchall()]
+            
+            if not queue_ids:
+                return 0
+            
+            placeholders = ", ".join("?" for _ in queue_ids)
+            await db.execute(f"""
+                INSERT OR REPLACE INTO generation_history (
+                    id, session_id, user_id, status, attempts,
+                    error_message, created_at, completed_at, timings
+                )
+                SELECT id, session_id, user_id, status, attempts,
+                       error_message, created_at, completed_at, timings
+                FROM generation_queue
+                WHERE id IN ({placeholders})
+            """, queue_ids)
+            cursor = await db.execute(
+                f"DELETE FROM generation_queue WHERE id IN ({placeholders})", queue_ids
+            )
             await db.commit()
             return cursor.rowcount
 
 
 async def init_database(db_path: str = "bot_data.db"):
     """Инициализировать базу данных"""
-    async with aiosqlite.connect(db_path) as db:
+    async with open_connection(db_path) as db:
         # Таблица сессий
         await db.execute("""
             CREATE TABLE IF NOT EXISTS sessions (
@@ -0,0 +1,101 @@
+"""
+Circuit breaker для внешних API
+"""
+
+import time
+from typing import Any, Dict, Optional
+
+from ..config import logger
+
+
+class CircuitBreaker:
+    """Размыкатель цепи: после серии сбоев перестает пропускать запросы.
+
+    closed - запросы идут как обычно.
+    open - запросы не отправляются recovery_timeout секунд.
+    half_open - пропускается одна пробная попытка: успех замыкает цепь,
+    сбой снова размыкает.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30) -> None:
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        # Время начала пробного запроса. Если он не отчитался за recovery_timeout
+        # (например, задачу отменили), разрешается следующая проба
+        self._trial_started_at: Optional[float] = None
+        self.open_count = 0
+
+    @property
+    def state(self) -> str:
+        """Текущее состояние (open переходит в half_open по истечении таймаута)"""
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._set_state(self.HALF_OPEN)
+            self._trial_started_at = None
+        return self._state
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == self.OPEN
+
+    def _set_state(self, state: str) -> None:
+        if state != self._state:
+            logger.warning(f"Circuit breaker {self.name}: {self._state} -> {state}")
+            self._state = state
+
+    def allow_request(self) -> bool:
+        """Можно ли отправить запрос сейчас. В half_open занимает пробную попытку"""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.OPEN:
+            return False
+
+        now = time.monotonic()
+        if self._trial_started_at is None or now - self._trial_started_at >= self.recovery_timeout:
+            self._trial_started_at = now
+            return True
+        return False
+
+    def retry_after(self) -> float:
+        """Через сколько секунд стоит снова проверить allow_request"""
+        state = self.state
+        now = time.monotonic()
+        if state == self.OPEN:
+            return max(0.0, self.recovery_timeout - (now - self._opened_at))
+        if state == self.HALF_OPEN and self._trial_started_at is not None:
+            return max(1.0, self.recovery_timeout - (now - self._trial_started_at))
+        return 0.0
+
+    def record_success(self) -> None:
+        """Запрос дошел до сервиса (в том числе ответ с ошибкой запроса)"""
+        self._failures = 0
+        self._trial_started_at = None
+        self._set_state(self.CLOSED)
+
+    def record_failure(self) -> None:
+        """Сервис недоступен: таймаут, сетевая ошибка или 5xx"""
+        self._failures += 1
+        self._trial_started_at = None
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != self.OPEN:
+                self.open_count += 1
+            self._opened_at = time.monotonic()
+            self._set_state(self.OPEN)
+
+    def stats(self) -> Dict[str, Any]:
+        """Состояние для мониторинга"""
+        return {
+            "state": self.state,
+            "failures": self._failures,
+            "opened": self.open_count,
+            "retry_after": self.retry_after()
+        }
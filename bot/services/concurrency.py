@@ -0,0 +1,169 @@
+"""
+Адаптивное ограничение одновременных запросов к OpenAI (AIMD)
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+from contextlib import asynccontextmanager
+
+from ..config import logger
+
+
+class AdaptiveLimiter:
+    """Семафор с изменяемым во время работы лимитом.
+
+    Успешные запросы медленно увеличивают лимит (+1 за каждые limit успешных
+    запросов), ответы 429 и рост задержки - быстро уменьшают его. Текущий лимит
+    доступен в limit и stats() для мониторинга.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int,
+        min_limit: int = 1,
+        max_limit: int = 20,
+        latency_target: float = 0,
+        decrease_factor: float = 0.5,
+        latency_window: int = 50
+    ) -> None:
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._latencies: Deque[float] = deque(maxlen=latency_window)
+        # Запросы, начатые до последнего уменьшения, не уменьшают лимит повторно
+        self._last_decrease_at = 0.0
+        # До этого момента новые запросы не начинаются (Retry-After)
+        self._paused_until = 0.0
+        self._remaining_requests: Optional[int] = None
+        self.rate_limited_count = 0
+
+    @property
+    def capacity(self) -> int:
+        """Текущее число одновременных запросов"""
+        return max(self.min_limit, int(self.limit))
+
+    def _can_start(self) -> bool:
+        return self.in_flight < self.capacity and time.monotonic() >= self._paused_until
+
+    def _wake_waiters(self) -> None:
+        free = self.capacity - self.in_flight
+        for waiter in self._waiters:
+            if free <= 0:
+                break
+            # Уже разбуженные ожидающие тоже займут слот
+            if not waiter.done():
+                waiter.set_result(None)
+            free -= 1
+
+    async def acquire(self) -> float:
+        """Занять слот. Возвращает время начала запроса (monotonic)"""
+        while not self._can_start():
+            delay = self._paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                self._waiters.remove(waiter)
+                if not waiter.cancelled():
+                    # Слот был отдан этому ожидающему - передаем его следующему
+                    self._wake_waiters()
+                raise
+            self._waiters.remove(waiter)
+
+        self.in_flight += 1
+        return time.monotonic()
+
+    def release(self) -> None:
+        """Освободить слот"""
+        self.in_flight -= 1
+        self._wake_waiters()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[float]:
+        """Контекстный менеджер слота, отдает время начала запроса"""
+        started_at = await self.acquire()
+        try:
+            yield started_at
+        finally:
+            self.release()
+
+    def _decrease(self, started_at: float, factor: float, reason: str) -> None:
+        if started_at < self._last_decrease_at:
+            return  # Реакция на эту перегрузку уже была
+        old_limit = self.limit
+        self.limit = max(float(self.min_limit), self.limit * factor)
+        self._last_decrease_at = time.monotonic()
+        # Задержки при прежнем лимите не должны вызвать повторное уменьшение
+        self._latencies.clear()
+        if int(old_limit) != int(self.limit):
+            logger.warning(f"Лимит OpenAI уменьшен {int(old_limit)} -> {self.capacity}: {reason}")
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """Перцентиль задержки последних запросов"""
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(percentile * len(ordered)))]
+
+    def record_success(
+        self,
+        started_at: float,
+        remaining_requests: Optional[int] = None
+    ) -> None:
+        """Учесть успешный запрос и заголовки лимитов из ответа"""
+        if started_at >= self._last_decrease_at:
+            # Окно задержек копится заново после каждого уменьшения
+            self._latencies.append(time.monotonic() - started_at)
+        if remaining_requests is not None:
+            self._remaining_requests = remaining_requests
+
+        p90 = self.latency_percentile(0.9)
+        if (
+            self.latency_target > 0
+            and len(self._latencies) >= 10
+            and p90 is not None
+            and p90 > self.latency_target
+        ):
+            self._decrease(started_at, 0.9, f"p90 задержки {p90:.1f}s")
+        elif remaining_requests is not None and remaining_requests <= self.in_flight:
+            # Квота почти исчерпана - не наращиваем параллельность
+            pass
+        elif self.limit < self.max_limit:
+            old_capacity = self.capacity
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            if self.capacity > old_capacity:
+                logger.info(f"Лимит OpenAI увеличен до {self.capacity}")
+
+        self._wake_waiters()
+
+    def record_rate_limited(self, started_at: float, retry_after: Optional[float] = None) -> None:
+        """Учесть ответ 429"""
+        self.rate_limited_count += 1
+        self._decrease(started_at, self.decrease_factor, "rate limit")
+        if retry_after:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        """Состояние лимитера для мониторинга"""
+        return {
+            "limit": self.capacity,
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "latency_p50": self.latency_percentile(0.5),
+            "latency_p90": self.latency_percentile(0.9),
+            "remaining_requests": self._remaining_requests,
+            "rate_limited": self.rate_limited_count,
+            "paused_for": max(0.0, self._paused_until - time.monotonic())
+        }
@@ -0,0 +1,154 @@
+"""
+Ограниченный по размеру кэш изображений: LRU в памяти и опционально на диске
+"""
+
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+from ..config import logger
+
+
+class ImageCache:
+    """Двухуровневый кэш байтов изображений по ключу.
+
+    Ключ - постоянный идентификатор содержимого (например, file_unique_id
+    из Telegram), поэтому записи не устаревают и вытесняются только по размеру.
+    """
+
+    def __init__(
+        self,
+        memory_limit_bytes: int,
+        disk_dir: Optional[str] = None,
+        disk_limit_bytes: int = 0,
+        name: str = "images"
+    ) -> None:
+        self.name = name
+        self.memory_limit = memory_limit_bytes
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_size = 0
+
+        self.disk_dir = Path(disk_dir) / name if disk_dir and disk_limit_bytes > 0 else None
+        self.disk_limit = disk_limit_bytes
+        self._disk_size: Optional[int] = None  # Считается при первом обращении к диску
+        self._disk_lock = asyncio.Lock()
+
+        self.stats: Dict[str, int] = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def _disk_path(self, key: str) -> Path:
+        # Имя файла - хэш ключа, чтобы ключ не влиял на путь
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return self.disk_dir / digest[:2] / digest
+
+    def _put_memory(self, key: str, data: bytes) -> None:
+        if len(data) > self.memory_limit:
+            return
+
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= len(old)
+
+        self._memory[key] = data
+        self._memory_size += len(data)
+
+        # Вытесняем давно не использованные записи
+        while self._memory_size > self.memory_limit:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Получить изображение из кэша"""
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return data
+
+        if self.disk_dir is not None:
+            data = await asyncio.to_thread(self._read_disk, self._disk_path(key))
+            if data is not None:
+                self.stats["disk_hits"] += 1
+                self._put_memory(key, data)
+                return data
+
+        self.stats["misses"] += 1
+        return None
+
+    async def put(self, key: str, data: bytes) -> None:
+        """Сохранить изображение в кэш"""
+        self._put_memory(key, data)
+
+        if self.disk_dir is None or len(data) > self.disk_limit:
+            return
+
+        async with self._disk_lock:
+            try:
+                if self._disk_size is None:
+                    self._disk_size = await asyncio.to_thread(self._scan_disk_size)
+                written = await asyncio.to_thread(self._write_disk, self._disk_path(key), data)
+                self._disk_size += written
+                if self._disk_size > self.disk_limit:
+                    self._disk_size = await asyncio.to_thread(self._evict_disk)
+            except OSError as e:
+                logger.warning(f"Ошибка дискового кэша {self.name}: {e}")
+
+    def _read_disk(self, path: Path) -> Optional[bytes]:
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        # Обновляем mtime - по нему работает вытеснение давно не использованных файлов
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def _write_disk(self, path: Path, data: bytes) -> int:
+        if path.exists():
+            os.utime(path)
+            return 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Атомарная запись: читатель никогда не увидит недописанный файл
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        return len(data)
+
+    def _iter_disk_files(self):
+        if not self.disk_dir.exists():
+            return []
+        return [path for path in self.disk_dir.glob("*/*") if path.suffix != ".tmp"]
+
+    def _scan_disk_size(self) -> int:
+        return sum(path.stat().st_size for path in self._iter_disk_files())
+
+    def _evict_disk(self) -> int:
+        """Удалить старые файлы, пока кэш не станет меньше 90% лимита"""
+        files = []
+        for path in self._iter_disk_files():
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        target = int(self.disk_limit * 0.9)
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= target:
+                break
+            try:
+                path.unlink()
+                total -= size
+                removed += 1
+            except OSError:
+                continue
+
+        if removed:
+            logger.info(f"Дисковый кэш {self.name}: удалено {removed} файлов")
+        return total
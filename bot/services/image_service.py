@@ -0,0 +1,83 @@
+"""
+Предобработка входных изображений перед отправкой в OpenAI
+"""
+
+import asyncio
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+from ..config import logger, IMAGE_PREPROCESS_ENABLED, IMAGE_MAX_SIDE, IMAGE_JPEG_QUALITY, IMAGE_PROCESS_WORKERS
+from ..image_processing import preprocess_image_sync
+
+
+# Пул процессов для CPU-нагрузки (декодирование, ресайз, кодирование)
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Получить (или создать) пул процессов предобработки"""
+    global _executor
+    if _executor is None:
+        # spawn не наследует потоки aiosqlite и event loop родительского процесса
+        _executor = ProcessPoolExecutor(
+            max_workers=max(1, IMAGE_PROCESS_WORKERS),
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+
+def shutdown_executor() -> None:
+    """Остановить пул процессов (для graceful shutdown)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def dedupe_images(images: List[bytes]) -> List[bytes]:
+    """Убрать одинаковые изображения, сохранив порядок"""
+    seen = set()
+    unique = []
+    for data in images:
+        digest = hashlib.sha256(data).digest()
+        if digest not in seen:
+            seen.add(digest)
+            unique.append(data)
+    return unique
+
+
+async def preprocess_images(images: List[bytes]) -> List[bytes]:
+    """Подготовить входные изображения к отправке в OpenAI"""
+    unique = dedupe_images(images)
+    if len(unique) < len(images):
+        logger.info(f"Удалено дубликатов изображений: {len(images) - len(unique)}")
+
+    if not IMAGE_PREPROCESS_ENABLED or not unique:
+        return unique
+
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    results = await asyncio.gather(
+        *(
+            loop.run_in_executor(executor, preprocess_image_sync, data, IMAGE_MAX_SIDE, IMAGE_JPEG_QUALITY)
+            for data in unique
+        ),
+        return_exceptions=True
+    )
+
+    processed = []
+    for original, result in zip(unique, results):
+        if isinstance(result, BaseException):
+            # Не блокируем генерацию: OpenAI примет исходное изображение
+            logger.warning(f"Не удалось обработать изображение: {type(result).__name__}: {result}")
+            processed.append(original)
+        else:
+            processed.append(result)
+
+    logger.info(
+        f"Предобработка изображений: {sum(map(len, unique)) // 1024}KB -> "
+        f"{sum(map(len, processed)) // 1024}KB"
+    )
+    return processed
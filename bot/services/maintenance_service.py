@@ -0,0 +1,150 @@
+"""
+Фоновое обслуживание БД: удаление устаревших сессий и зависших задач очереди,
+перенос старых завершенных задач в историю и возврат освободившегося места.
+
+Работа идет небольшими пачками с паузами между ними, чтобы не занимать
+блокировку записи SQLite надолго и не задерживать запросы пользователей.
+"""
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from ..config import (
+    logger,
+    SESSION_EXPIRE_MINUTES,
+    MAINTENANCE_INTERVAL_SECONDS,
+    MAINTENANCE_BATCH_SIZE,
+    MAINTENANCE_BATCH_PAUSE_MS,
+    MAINTENANCE_MAX_BATCHES,
+    MAINTENANCE_VACUUM_PAGES,
+    QUEUE_STALE_MINUTES,
+    QUEUE_RETENTION_DAYS
+)
+from ..repositories.pool import get_pool
+from ..repositories.sqlite import SQLiteSessionRepository, SQLiteQueueRepository
+
+session_repository = SQLiteSessionRepository()
+queue_repository = SQLiteQueueRepository()
+
+_janitor_task: Optional[asyncio.Task] = None
+
+# Метрики для /status и логов
+maintenance_stats: Dict[str, Any] = {
+    "runs": 0,
+    "errors": 0,
+    "sessions_expired": 0,
+    "stale_items_failed": 0,
+    "items_archived": 0,
+    "pages_vacuumed": 0,
+    "last_run_at": None,
+    "last_duration": None
+}
+
+
+async def run_batched(job: Callable[[int], Awaitable[int]]) -> int:
+    """Вызывать job(batch_size), пока он обрабатывает полные пачки (не больше MAINTENANCE_MAX_BATCHES)"""
+    batch_size = max(1, MAINTENANCE_BATCH_SIZE)
+    total = 0
+    for batch in range(max(1, MAINTENANCE_MAX_BATCHES)):
+        if batch > 0:
+            # Между пачками отдаем блокировку записи другим запросам
+            await asyncio.sleep(MAINTENANCE_BATCH_PAUSE_MS / 1000)
+        processed = await job(batch_size)
+        total += processed
+        if processed < batch_size:
+            break
+    return total
+
+
+async def expire_sessions() -> int:
+    """Удалить неоплаченные сессии старше SESSION_EXPIRE_MINUTES"""
+    return await run_batched(
+        lambda limit: session_repository.cleanup_expired_sessions(SESSION_EXPIRE_MINUTES, limit=limit)
+    )
+
+
+async def fail_stale_items() -> int:
+    """Завершить задачи, зависшие в processing без аренды"""
+    return await run_batched(
+        lambda limit: queue_repository.cleanup_stale_items(QUEUE_STALE_MINUTES, limit=limit)
+    )
+
+
+async def archive_finished_items() -> int:
+    """Перенести завершенные задачи старше QUEUE_RETENTION_DAYS в generation_history"""
+    if QUEUE_RETENTION_DAYS == 0:
+        return 0
+    return await run_batched(
+        lambda limit: queue_repository.archive_finished_items(QUEUE_RETENTION_DAYS, limit=limit)
+    )
+
+
+async def vacuum_free_pages() -> int:
+    """Вернуть ОС место, освободившееся после удалений"""
+    if MAINTENANCE_VACUUM_PAGES == 0:
+        return 0
+    return await get_pool().incremental_vacuum(MAINTENANCE_VACUUM_PAGES)
+
+
+async def run_maintenance() -> Dict[str, Any]:
+    """Один проход обслуживания"""
+    started_at = time.monotonic()
+
+    sessions_expired = await expire_sessions()
+    stale_items_failed = await fail_stale_items()
+    items_archived = await archive_finished_items()
+    pages_vacuumed = await vacuum_free_pages()
+
+    maintenance_stats["runs"] += 1
+    maintenance_stats["sessions_expired"] += sessions_expired
+    maintenance_stats["stale_items_failed"] += stale_items_failed
+    maintenance_stats["items_archived"] += items_archived
+    maintenance_stats["pages_vacuumed"] += pages_vacuumed
+    maintenance_stats["last_run_at"] = datetime.now().isoformat(timespec="seconds")
+    maintenance_stats["last_duration"] = round(time.monotonic() - started_at, 3)
+
+    if sessions_expired or stale_items_failed or items_archived or pages_vacuumed:
+        logger.info(
+            f"Обслуживание: удалено сессий {sessions_expired}, "
+            f"завершено зависших задач {stale_items_failed}, "
+            f"перенесено в историю {items_archived}, "
+            f"освобождено страниц {pages_vacuumed} "
+            f"за {maintenance_stats['last_duration']:.2f}s"
+        )
+    return maintenance_stats
+
+
+async def janitor_loop() -> None:
+    """Периодическое обслуживание раз в MAINTENANCE_INTERVAL_SECONDS"""
+    while True:
+        try:
+            await run_maintenance()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            maintenance_stats["errors"] += 1
+            logger.error(f"Ошибка обслуживания БД: {e}")
+        await asyncio.sleep(max(1, MAINTENANCE_INTERVAL_SECONDS))
+
+
+def start_janitor() -> None:
+    """Запустить фоновое обслуживание если оно еще не запущено"""
+    global _janitor_task
+    if MAINTENANCE_INTERVAL_SECONDS == 0:
+        return  # Обслуживание выполняет другой экземпляр
+    if _janitor_task and not _janitor_task.done():
+        return
+    _janitor_task = asyncio.create_task(janitor_loop())
+
+
+async def stop_janitor() -> None:
+    """Остановить фоновое обслуживание"""
+    global _janitor_task
+    if _janitor_task and not _janitor_task.done():
+        _janitor_task.cancel()
+        try:
+            await _janitor_task
+        except asyncio.CancelledError:
+            pass
+    _janitor_task = None
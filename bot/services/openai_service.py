@@ -1,54 +1,129 @@
 import base64
-import os
 import asyncio
-from typing import List, Optional
-from openai import AsyncOpenAI
-from ..config import OPENAI_API_KEY, logger, OPENAI_CONCURRENT_LIMIT
+from typing import List, Mapping, Optional, Tuple
+from openai import AsyncOpenAI, APIConnectionError, InternalServerError, RateLimitError
+from ..config import (
+    OPENAI_API_KEY, logger, OPENAI_CONCURRENT_LIMIT, OPENAI_CONCURRENT_MIN, OPENAI_CONCURRENT_MAX,
+    OPENAI_LATENCY_TARGET, OPENAI_TIMEOUT_SECONDS, OPENAI_BREAKER_FAILURES, OPENAI_BREAKER_RECOVERY_SECONDS,
+    PROMPT_CACHE_ENABLED, PROMPT_CACHE_TTL_SECONDS, PROMPT_CACHE_MAX_ENTRIES
+)
 from .. import messages
+from .circuit_breaker import CircuitBreaker
+from .concurrency import AdaptiveLimiter
+from .prompt_cache import PromptCache
 
 
 class GenerationError(Exception):
-    """Кастомное исключение для ошибок генерации"""
-    pass
+    """Кастомное исключение для ошибок генерации.
+    
+    retryable - временная ошибка (таймаут, 429, 5xx), задачу можно повторить.
+    retry_after - пауза перед повтором, которую просит OpenAI, в секундах.
+    """
+    
+    def __init__(self, message: str, retryable: bool = False, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+# Ограничение одновременных генераций. Лимит подстраивается под 429 и задержку ответов
+generation_limiter = AdaptiveLimiter(
+    initial_limit=OPENAI_CONCURRENT_LIMIT,
+    min_limit=OPENAI_CONCURRENT_MIN,
+    max_limit=OPENAI_CONCURRENT_MAX,
+    latency_target=OPENAI_LATENCY_TARGET
+)
+
+# Размыкается после серии таймаутов / 5xx подряд, пока OpenAI недоступен
+openai_breaker = CircuitBreaker(
+    "openai",
+    failure_threshold=OPENAI_BREAKER_FAILURES,
+    recovery_timeout=OPENAI_BREAKER_RECOVERY_SECONDS
+)
+
+openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, timeout=OPENAI_TIMEOUT_SECONDS)
+
+# Параметры генерации с нуля - входят и в запрос, и в ключ кэша промптов
+TEXT_GENERATION_PARAMS = {
+    "model": "gpt-image-1",
+    "quality": "high",
+    "output_format": "jpeg"
+}
+
+# Кэш результатов одинаковых текстовых промптов
+prompt_cache = PromptCache(ttl_seconds=PROMPT_CACHE_TTL_SECONDS, max_entries=PROMPT_CACHE_MAX_ENTRIES)
+
+
+def detect_image_type(data: bytes) -> Tuple[str, str]:
+    """Определить расширение и MIME-тип изображения по сигнатуре"""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png", "image/png"
+    if data.startswith(b"RIFF") and data[8:12] == b"WEBP":
+        return "webp", "image/webp"
+    # Фото из Telegram приходят в JPEG
+    return "jpg", "image/jpeg"
+
+
+def parse_remaining_requests(headers: Mapping[str, str]) -> Optional[int]:
+    """Остаток запросов в текущем окне из заголовков OpenAI"""
+    try:
+        return int(headers.get("x-ratelimit-remaining-requests"))
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Пауза из заголовков retry-after-ms / retry-after в секундах"""
+    try:
+        return float(headers.get("retry-after-ms")) / 1000
+    except (TypeError, ValueError):
+        pass
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
 
 
-# Семафор для ограничения одновременных генераций
-generation_semaphore = asyncio.Semaphore(OPENAI_CONCURRENT_LIMIT)
-# Счётчик активных генераций с блокировкой
-active_generations = 0
-active_generations_lock = asyncio.Lock()
+def to_upload_file(index: int, data: bytes) -> Tuple[str, bytes, str]:
+    """Подготовить изображение к загрузке в OpenAI без записи на диск"""
+    extension, mime_type = detect_image_type(data)
+    return (f"image_{index}.{extension}", data, mime_type)
 
-openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
 
 async def generate_image(prompt: str, input_images: Optional[List[bytes]] = None) -> bytes:
     """Генерация изображения через OpenAI API"""
-    import tempfile
-    temp_files = []
+    if PROMPT_CACHE_ENABLED and not input_images:
+        # Одинаковые текстовые промпты получают один и тот же результат,
+        # а одновременные дубликаты ждут уже идущий запрос
+        key = prompt_cache.make_key(prompt, **TEXT_GENERATION_PARAMS)
+        return await prompt_cache.get_or_create(key, lambda: _generate_image(prompt, None))
+
+    return await _generate_image(prompt, input_images)
+
+
+async def _generate_image(prompt: str, input_images: Optional[List[bytes]] = None) -> bytes:
+    """Запрос к OpenAI API с ограничением одновременных генераций"""
+    # Пока OpenAI недоступен, задача ждет пробного запроса, а не тратит попытку
+    while not openai_breaker.allow_request():
+        await asyncio.sleep(openai_breaker.retry_after())
     
     # Ограничиваем количество одновременных запросов
-    global active_generations
-    async with generation_semaphore:
-        # Увеличиваем счётчик с блокировкой
-        async with active_generations_lock:
-            active_generations += 1
-            current_active = active_generations
-        
-        logger.info(f"Начало генерации. Активных запросов: {current_active}/{OPENAI_CONCURRENT_LIMIT}")
+    async with generation_limiter.slot() as started_at:
+        logger.info(
+            f"Начало генерации. Активных запросов: "
+            f"{generation_limiter.in_flight}/{generation_limiter.capacity}"
+        )
         
         try:
-            if input_images:
-                # Редактирование с входными изображениями
-                files = []
-                for i, img_bytes in enumerate(input_images):
-                    # Используем tempfile для безопасного создания временных файлов
-                    temp_file = tempfile.NamedTemporaryFile(suffix='.png', delete=False)
-                    temp_files.append(temp_file.name)
-                    temp_file.write(img_bytes)
-                    temp_file.close()
-                    files.append(open(temp_file.name, 'rb'))
+            # Общий бюджет запроса, включая повторы внутри SDK. Слот лимитера
+            # освобождается при отмене по таймауту
+            async with asyncio.timeout(OPENAI_TIMEOUT_SECONDS):
+                if input_images:
+                    # Редактирование с входными изображениями.
+                    # Байты передаются клиенту напрямую как (имя, данные, MIME)
+                    files = [to_upload_file(i, img_bytes) for i, img_bytes in enumerate(input_images)]
                 
-                try:
-                    response = await openai_client.images.edit(
+                    raw_response = await openai_client.images.with_raw_response.edit(
                         model="gpt-image-1",
                         image=files[0] if len(files) == 1 else files,
                         prompt=prompt,
@@ -58,17 +133,20 @@ async def generate_image(prompt: str, input_images: Optional[List[bytes]] = None
                         quality="high",
                         background="auto"
                     )
-                finally:
-                    for f in files:
-                        f.close()
-            else:
-                # Генерация с нуля
-                response = await openai_client.images.generate(
-                    model="gpt-image-1",
-                    prompt=prompt,
-                    quality="high",
-                    output_format="jpeg"
-                )
+                else:
+                    # Генерация с нуля
+                    raw_response = await openai_client.images.with_raw_response.generate(
+                        prompt=prompt,
+                        **TEXT_GENERATION_PARAMS
+                    )
+            
+            # Заголовки лимитов нужны лимитеру, поэтому читаем сырой ответ
+            response = raw_response.parse()
+            openai_breaker.record_success()
+            generation_limiter.record_success(
+                started_at,
+                parse_remaining_requests(raw_response.headers)
+            )
             
             image_base64 = response.data[0].b64_json
             return base64.b64decode(image_base64)
@@ -76,6 +154,21 @@ async def generate_image(prompt: str, input_images: Optional[List[bytes]] = None
         except Exception as e:
             logger.error(f"Ошибка генерации: {type(e).__name__}: {e}")
             
+            # Таймауты, сетевые ошибки, 5xx и 429 по частоте запросов - временные.
+            # Модерация, авторизация и исчерпанная квота повтором не исправляются
+            retry_after = None
+            retryable = isinstance(e, (APIConnectionError, InternalServerError, TimeoutError))
+            if retryable:
+                openai_breaker.record_failure()
+            else:
+                # Ответ с ошибкой запроса - сервис доступен
+                openai_breaker.record_success()
+            if isinstance(e, RateLimitError) and e.code != "insufficient_quota":
+                retryable = True
+                retry_after = parse_retry_after(e.response.headers)
+                # 429 уменьшает лимит одновременных запросов
+                generation_limiter.record_rate_limited(started_at, retry_after)
+            
             # Обрабатываем разные типы ошибок
             error_message = messages.OPENAI_ERROR_GENERIC
             
@@ -99,22 +192,10 @@ async def generate_image(prompt: str, input_images: Optional[List[bytes]] = None
                 error_message = messages.OPENAI_ERROR_AUTH
             elif "model_not_found" in error_str:
                 error_message = messages.OPENAI_ERROR_MODEL
-            elif "timeout" in error_str:
+            elif "timeout" in error_str or isinstance(e, TimeoutError):
                 error_message = messages.OPENAI_ERROR_TIMEOUT
             elif "insufficient_quota" in error_str:
                 error_message = messages.OPENAI_ERROR_QUOTA
             
             # Создаем кастомное исключение с понятным сообщением
-            raise GenerationError(error_message) from e
-        finally:
-            # Всегда удаляем временные файлы
-            for temp_path in temp_files:
-                try:
-                    os.remove(temp_path)
-                except Exception:
-                    # Оставляем Exception в finally блоке для гарантии завершения очистки
-                    pass  # Игнорируем ошибки удаления
-            
-            # Уменьшаем счётчик с блокировкой
-            async with active_generations_lock:
-                active_generations -= 1
\ No newline at end of file
+            raise GenerationError(error_message, retryable=retryable, retry_after=retry_after) from e
@@ -2,7 +2,7 @@ from typing import Optional, Tuple
 from aiogram import Bot
 from aiogram.types import LabeledPrice, Message
 
-from ..config import GENERATION_PRICE, logger, payment_logger, TEST_MODE, MAX_PROMPT_LENGTH, INVOICE_PHOTO_URL, SESSION_EXPIRE_MINUTES
+from ..config import GENERATION_PRICE, logger, payment_logger, TEST_MODE, MAX_PROMPT_LENGTH, INVOICE_PHOTO_URL
 from .. import messages
 from ..repositories.base import SessionRepository, PaymentRepository
 from ..repositories.sqlite import SQLiteSessionRepository, SQLitePaymentRepository
@@ -25,12 +25,10 @@ class PaymentService:
         # Валидируем данные через Pydantic
         session_data = SessionCreate(user_id=user_id, images=images, prompt=prompt)
         
-        # Очищаем старые сессии
-        await self.session_repo.cleanup_expired_sessions(SESSION_EXPIRE_MINUTES)
-        
+        # Устаревшие сессии удаляет фоновое обслуживание (maintenance_service)
         return await self.session_repo.create_session(
             session_data.user_id, 
-            session_data.images, 
+            [image.model_dump() for image in session_data.images], 
             session_data.prompt
         )
     
@@ -0,0 +1,102 @@
+"""
+Мемоизация результатов генерации по тексту промпта
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from ..config import logger
+
+
+class PromptCache:
+    """Кэш результатов генерации без входных изображений.
+
+    Ключ - нормализованный промпт вместе с параметрами генерации. Пока первый
+    запрос выполняется, одинаковые запросы ждут его результата (single-flight),
+    а не отправляют свои запросы в OpenAI.
+    """
+
+    def __init__(self, ttl_seconds: int, max_entries: int) -> None:
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats: Dict[str, int] = {"hits": 0, "shared": 0, "misses": 0}
+
+    @staticmethod
+    def make_key(prompt: str, **params: Any) -> str:
+        """Ключ кэша: промпт без различий в регистре и пробелах + параметры"""
+        normalized = " ".join(prompt.split()).casefold()
+        payload = json.dumps({"prompt": normalized, **params}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Получить неистекший результат"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, data = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """Сохранить результат"""
+        self._entries[key] = (time.monotonic() + self.ttl, data)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_create(self, key: str, factory: Callable[[], Awaitable[bytes]]) -> bytes:
+        """Вернуть результат из кэша, дождаться идущего запроса или выполнить factory"""
+        while True:
+            cached = self.get(key)
+            if cached is not None:
+                self.stats["hits"] += 1
+                return cached
+
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+
+            self.stats["shared"] += 1
+            logger.info("Ожидание идентичной генерации, уже выполняющейся")
+            try:
+                # shield: отмена ожидающего не должна отменять общий запрос
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # Отменили сам ожидающий запрос - отменяемся и мы
+                if not inflight.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                # Отменили выполнявший запрос (дедлайн задачи, остановка) - первый
+                # из ожидающих выполняет factory сам, остальные ждут уже его
+                logger.info("Идентичная генерация отменена, запрос выполняется заново")
+
+        self.stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        # Ошибку получают только ожидающие - без них не логируем "never retrieved"
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            self.put(key, result)
+            future.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
@@ -1,12 +1,28 @@
 import asyncio
-from typing import Dict, Any, Optional
+import os
+import random
+import socket
+import time
+import uuid
+import aiohttp
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Any, List, Optional
 from datetime import datetime
 from aiogram import Bot
 from aiogram.types import BufferedInputFile
-from ..config import logger, TEST_MODE
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter
+from ..config import (
+    logger, TEST_MODE, QUEUE_PREFETCH,
+    QUEUE_POLL_INTERVAL, QUEUE_LEASE_SECONDS, QUEUE_HEARTBEAT_SECONDS,
+    QUEUE_MAX_ATTEMPTS, QUEUE_RETRY_BASE_DELAY, QUEUE_RETRY_MAX_DELAY, QUEUE_STALE_MINUTES,
+    JOB_DEADLINE_SECONDS, DOWNLOAD_TIMEOUT_SECONDS, DELIVERY_TIMEOUT_SECONDS,
+    RESULT_CACHE_MEMORY_MB, IMAGE_CACHE_DIR, IMAGE_CACHE_DISK_MB
+)
 from ..repositories.sqlite import SQLiteQueueRepository, SQLiteSessionRepository
-from .openai_service import generate_image, GenerationError, generation_semaphore
-from .telegram_service import download_image
+from .openai_service import generate_image, GenerationError, generation_limiter, openai_breaker
+from .telegram_service import download_images
+from .image_service import preprocess_images
+from .image_cache import ImageCache
 from . import payment_service
 from .. import messages
 
@@ -14,6 +30,21 @@ from .. import messages
 queue_repository = SQLiteQueueRepository()
 session_repository = SQLiteSessionRepository()
 
+# Идентификатор этого процесса в generation_queue.worker_id. Случайный суффикс:
+# перезапущенный контейнер получает тот же hostname и PID и не должен считать
+# аренды прежнего процесса своими
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Кэш сгенерированных изображений по задаче - повторная доставка без новой генерации
+result_cache = ImageCache(
+    memory_limit_bytes=RESULT_CACHE_MEMORY_MB * 1024 * 1024,
+    disk_dir=IMAGE_CACHE_DIR or None,
+    disk_limit_bytes=IMAGE_CACHE_DISK_MB * 1024 * 1024,
+    name="results"
+)
+# Попыток отправки результата при сетевых ошибках Telegram
+DELIVERY_ATTEMPTS = 3
+
 # Флаг для управления паузой
 queue_paused = False
 # Список активных задач
@@ -24,6 +55,14 @@ bot_instance: Optional[Bot] = None
 queue_processing_semaphore = asyncio.Semaphore(1)
 # Задача worker'а очереди
 _queue_worker_task: Optional[asyncio.Task] = None
+# Событие для пробуждения worker'а (новая задача, освободившийся слот, возобновление очереди)
+queue_wakeup = asyncio.Event()
+# Задача продления аренды взятых задач
+_heartbeat_task: Optional[asyncio.Task] = None
+# Обрабатывает ли этот процесс очередь (бот может только добавлять задачи)
+worker_enabled = True
+# Worker ждет освобождения слота (а не новых задач)
+_waiting_for_slot = False
 
 
 def set_bot(bot: Bot) -> None:
@@ -32,14 +71,35 @@ def set_bot(bot: Bot) -> None:
     bot_instance = bot
 
 
+def set_worker_enabled(enabled: bool) -> None:
+    """Включить или выключить обработку очереди в этом процессе"""
+    global worker_enabled
+    worker_enabled = enabled
+
+
+def notify_queue() -> None:
+    """Разбудить worker очереди"""
+    queue_wakeup.set()
+
+
+async def _wait_for_wakeup(timeout: Optional[float] = None) -> bool:
+    """Дождаться уведомления. Возвращает False, если сработал страховочный таймаут"""
+    try:
+        await asyncio.wait_for(queue_wakeup.wait(), timeout=timeout or QUEUE_POLL_INTERVAL)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
 async def add_to_queue(session_id: str, user_id: int, priority: int = 0) -> int:
     """Добавить генерацию в очередь"""
     queue_id = await queue_repository.add_to_queue(session_id, user_id, priority)
     logger.info(f"Добавлена задача в очередь: queue_id={queue_id}, session_id={session_id}")
     
-    # Убеждаемся что worker запущен
+    # Убеждаемся что worker запущен и будим его
     if not queue_paused:
         await start_queue_worker()
+        notify_queue()
     
     return queue_id
 
@@ -47,6 +107,8 @@ async def add_to_queue(session_id: str, user_id: int, priority: int = 0) -> int:
 async def pause_queue() -> None:
     """Поставить очередь на паузу"""
     global queue_paused
+    if queue_paused:
+        return
     queue_paused = True
     logger.info("Очередь поставлена на паузу")
 
@@ -59,6 +121,7 @@ async def resume_queue() -> None:
     
     # Запускаем worker
     await start_queue_worker()
+    notify_queue()
 
 
 async def get_queue_position(session_id: str) -> Optional[int]:
@@ -66,37 +129,91 @@ async def get_queue_position(session_id: str) -> Optional[int]:
     return await queue_repository.get_queue_position(session_id)
 
 
+async def get_queue_stats() -> Dict[str, Any]:
+    """Состояние очереди и лимита OpenAI для мониторинга"""
+    return {
+        "pending": await queue_repository.get_pending_count(),
+        "active": len(active_tasks),
+        "paused": queue_paused,
+        "openai": generation_limiter.stats(),
+        "breaker": openai_breaker.stats()
+    }
+
+
+def free_slots() -> int:
+    """Количество свободных слотов обработки.
+    
+    Сверх лимита OpenAI берется QUEUE_PREFETCH задач: пока одни задачи ждут
+    ответа OpenAI, следующие уже скачивают и готовят входные изображения.
+    Лимит OpenAI адаптивный, поэтому число слотов меняется во время работы.
+    Пока circuit breaker OpenAI разомкнут, задачи не берутся (входные данные
+    не скачиваются впустую), в полуоткрытом состоянии - одна пробная.
+    """
+    state = openai_breaker.state
+    if state == openai_breaker.OPEN:
+        capacity = 0
+    elif state == openai_breaker.HALF_OPEN:
+        capacity = 1
+    else:
+        capacity = generation_limiter.capacity + QUEUE_PREFETCH
+    return max(0, capacity - len(active_tasks))
+
+
+async def claim_items(limit: int) -> List[Dict[str, Any]]:
+    """Забрать из очереди до limit задач (уже помеченных как processing)"""
+    async with queue_processing_semaphore:
+        # Все свободные слоты заполняются одной транзакцией
+        return await queue_repository.claim_batch(limit, WORKER_ID, QUEUE_LEASE_SECONDS)
+
+
 async def queue_items():
-    """Асинхронный генератор элементов очереди"""
+    """Асинхронный генератор элементов очереди.
+    
+    Задачи забираются из БД только под свободные слоты генерации,
+    поэтому их не приходится возвращать обратно в очередь.
+    """
+    global _waiting_for_slot
     while True:
+        # Сбрасываем событие до проверок и обращения к БД, чтобы не потерять уведомление
+        queue_wakeup.clear()
+        
         if queue_paused:
-            await asyncio.sleep(1)
+            await _wait_for_wakeup()
             continue
-            
-        async with queue_processing_semaphore:
-            # Получаем следующую задачу (уже помеченную как processing)
-            item = await queue_repository.get_next_in_queue()
-            if item:
-                yield item
-            else:
-                # Очередь пуста
-                await asyncio.sleep(1)
+        
+        slots = free_slots()
+        if slots == 0:
+            # Все слоты заняты - ждем завершения одной из генераций.
+            # При разомкнутом breaker'е просыпаемся к пробному запросу
+            _waiting_for_slot = True
+            try:
+                await _wait_for_wakeup(openai_breaker.retry_after())
+            finally:
+                _waiting_for_slot = False
+            continue
+        
+        items = await claim_items(slots)
+        for item in items:
+            yield item
+        
+        if len(items) == slots:
+            # Слоты заполнены, в очереди могут оставаться задачи
+            continue
+        
+        # Очередь пуста - ждем уведомления. Опрос БД остается только страховкой
+        # и идет через соединение на чтение, без транзакции на запись
+        while not await _wait_for_wakeup():
+            if not queue_paused and await queue_repository.get_pending_count() > 0:
+                break
 
 
 async def queue_worker():
     """Worker для обработки очереди через асинхронный итератор"""
     try:
         async for item in queue_items():
-            # Проверяем семафор генерации
-            if generation_semaphore._value > 0:
-                # Запускаем обработку
-                task = asyncio.create_task(process_queue_item(item))
-                active_tasks[item['id']] = task
-            else:
-                # Нет свободных слотов - возвращаем в очередь
-                await queue_repository.update_queue_status(item['id'], 'pending')
-                logger.info("Нет свободных слотов, элемент возвращен в очередь")
-                await asyncio.sleep(0.5)
+            # Слот уже зарезервирован при получении задачи - сразу запускаем обработку
+            task = asyncio.create_task(process_queue_item(item))
+            active_tasks[item['id']] = task
     except asyncio.CancelledError:
         logger.info("Queue worker cancelled")
         raise
@@ -107,15 +224,249 @@ async def queue_worker():
         await start_queue_worker()
 
 
+async def heartbeat_loop() -> None:
+    """Продлевает аренду своих задач и возвращает в очередь задачи упавших worker'ов"""
+    while True:
+        await asyncio.sleep(QUEUE_HEARTBEAT_SECONDS)
+        try:
+            queue_ids = list(active_tasks.keys())
+            if queue_ids:
+                renewed = set(await queue_repository.renew_leases(WORKER_ID, queue_ids, QUEUE_LEASE_SECONDS))
+                
+                # Задачу уже забрал другой worker - прекращаем обработку, иначе
+                # генерация и отправка выполнятся дважды
+                for queue_id in queue_ids:
+                    task = active_tasks.get(queue_id)
+                    if queue_id not in renewed and task and not task.done():
+                        logger.warning(f"Аренда queue_id={queue_id} потеряна worker'ом {WORKER_ID}, обработка отменена")
+                        task.cancel()
+            
+            reclaimed = await queue_repository.reclaim_expired_leases()
+            if reclaimed > 0:
+                logger.info(f"Возвращено в очередь задач с истекшей арендой: {reclaimed}")
+                notify_queue()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка продления аренды: {e}")
+
+
 async def start_queue_worker() -> None:
     """Запустить worker очереди если он еще не запущен"""
-    global _queue_worker_task
+    global _queue_worker_task, _heartbeat_task
+    
+    if not worker_enabled:
+        return  # Очередь обрабатывают отдельные процессы
+    
+    if not _heartbeat_task or _heartbeat_task.done():
+        _heartbeat_task = asyncio.create_task(heartbeat_loop())
     
     if _queue_worker_task and not _queue_worker_task.done():
         return  # Worker уже работает
     
     _queue_worker_task = asyncio.create_task(queue_worker())
-    logger.info("Queue worker started")
+    logger.info(f"Queue worker started: {WORKER_ID}")
+
+
+def result_cache_key(queue_id: int) -> str:
+    """Ключ результата задачи в кэше"""
+    return f"queue:{queue_id}"
+
+
+async def deliver_result(
+    queue_id: int,
+    chat_id: int,
+    caption: str,
+    image: Optional[bytes] = None,
+    file_id: Optional[str] = None
+) -> str:
+    """Отправить результат генерации и сохранить его file_id.
+    
+    Если file_id известен, фото отправляется по нему без повторной загрузки,
+    иначе загружаются байты из image или result_cache. Сохраненный file_id
+    означает, что результат уже доставлен пользователю.
+    
+    Повтор после TelegramNetworkError не идемпотентен: если Telegram принял
+    фото, но ответ не дошел, пользователь получит его дважды. Это лучше, чем
+    не доставить оплаченный результат.
+    """
+    if not bot_instance:
+        raise GenerationError("Бот не инициализирован")
+    
+    if file_id:
+        photo = file_id
+    else:
+        if image is None:
+            image = await result_cache.get(result_cache_key(queue_id))
+        if image is None:
+            raise GenerationError("Результат генерации не найден")
+        photo = BufferedInputFile(image, filename="generated.png")
+    
+    for attempt in range(1, DELIVERY_ATTEMPTS + 1):
+        try:
+            message = await bot_instance.send_photo(
+                chat_id=chat_id,
+                photo=photo,
+                caption=caption,
+                parse_mode="HTML"
+            )
+            break
+        except TelegramRetryAfter as e:
+            if attempt == DELIVERY_ATTEMPTS:
+                raise
+            await asyncio.sleep(e.retry_after)
+        except TelegramNetworkError as e:
+            if attempt == DELIVERY_ATTEMPTS:
+                raise
+            logger.warning(f"Ошибка отправки результата queue_id={queue_id}, попытка {attempt}: {e}")
+            await asyncio.sleep(attempt)
+    
+    if file_id:
+        return file_id
+    
+    file_id = message.photo[-1].file_id
+    await queue_repository.set_result_file_id(queue_id, file_id, worker_id=WORKER_ID)
+    return file_id
+
+
+async def resend_last_result(user_id: int) -> bool:
+    """Повторно отправить последний доставленный результат по file_id, без загрузки.
+    
+    False - у пользователя нет доставленных результатов.
+    """
+    item = await queue_repository.get_last_delivered(user_id)
+    if not item:
+        return False
+    
+    await deliver_result(item['id'], user_id, messages.RESULT_RESENT, file_id=item['result_file_id'])
+    return True
+
+
+def retry_delay(attempts: int, retry_after: Optional[float] = None) -> float:
+    """Экспоненциальная задержка перед повтором с jitter, не меньше Retry-After"""
+    delay = min(QUEUE_RETRY_MAX_DELAY, QUEUE_RETRY_BASE_DELAY * 2 ** max(0, attempts - 1))
+    # Половина задержки случайная, чтобы задачи после сбоя не повторялись одной волной
+    delay = delay / 2 + random.uniform(0, delay / 2)
+    return max(delay, retry_after or 0)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Временная ли ошибка (имеет смысл повторить задачу)"""
+    if isinstance(error, GenerationError):
+        return error.retryable
+    # Сетевые ошибки при скачивании входных фото и отправке результата
+    return isinstance(error, (aiohttp.ClientError, TelegramNetworkError, asyncio.TimeoutError))
+
+
+async def retry_later(queue_item: Dict[str, Any], error: Exception) -> bool:
+    """Отложить задачу для повторной попытки. False - ошибка постоянная или попытки исчерпаны"""
+    queue_id = queue_item['id']
+    attempts = queue_item.get('attempts') or 1
+    
+    if not is_retryable(error) or attempts >= QUEUE_MAX_ATTEMPTS:
+        return False
+    
+    delay = retry_delay(attempts, getattr(error, 'retry_after', None))
+    if not await queue_repository.schedule_retry(queue_id, delay, str(error), worker_id=WORKER_ID):
+        return False
+    
+    logger.warning(
+        f"Временная ошибка для queue_id={queue_id}, попытка {attempts}/{QUEUE_MAX_ATTEMPTS}. "
+        f"Повтор через {delay:.0f}s"
+    )
+    # Будим worker к моменту, когда задачу можно будет взять
+    asyncio.get_running_loop().call_later(delay, notify_queue)
+    
+    # Сообщаем пользователю только о первом повторе
+    if attempts == 1 and bot_instance:
+        try:
+            await bot_instance.send_message(
+                chat_id=queue_item['user_id'],
+                text=messages.GENERATION_RETRY_SCHEDULED
+            )
+        except Exception as e:
+            # Повтор уже запланирован - ошибка уведомления на него не влияет
+            logger.warning(f"Не удалось сообщить о повторе queue_id={queue_id}: {e}")
+    return True
+
+
+@asynccontextmanager
+async def stage(name: str, timeout: int, timings: Dict[str, float]) -> AsyncIterator[None]:
+    """Этап обработки задачи с бюджетом времени (0 - без ограничения).
+    
+    Длительность этапа записывается в timings. При превышении бюджета этап
+    отменяется, а наружу выходит TimeoutError с названием этапа.
+    """
+    started_at = time.monotonic()
+    deadline = asyncio.timeout(timeout or None)
+    try:
+        async with deadline:
+            yield
+    except TimeoutError as e:
+        if not deadline.expired():
+            raise  # Сработал бюджет вложенного этапа
+        raise TimeoutError(f"Превышено время этапа {name} ({timeout}s)") from e
+    finally:
+        timings[name] = round(time.monotonic() - started_at, 3)
+
+
+async def generate_and_deliver(
+    queue_item: Dict[str, Any],
+    session: Dict[str, Any],
+    timings: Dict[str, float]
+) -> None:
+    """Сгенерировать изображение задачи (если его еще нет) и отправить пользователю"""
+    queue_id = queue_item['id']
+    
+    # Задача могла вернуться в очередь уже после отправки результата (worker упал
+    # до отметки completed): file_id сохраняется только после успешной отправки,
+    # поэтому повторно ничего не отправляем. Пользователь может запросить
+    # результат сам (/result) - он будет отправлен по file_id без загрузки
+    if queue_item.get('result_file_id'):
+        logger.info(f"Результат queue_id={queue_id} уже доставлен, задача завершается")
+        return
+    
+    # Или после генерации, но до отправки - тогда отправляем готовый результат
+    result_image = await result_cache.get(result_cache_key(queue_id))
+    if result_image is not None:
+        logger.info(f"Повторная доставка готового результата для queue_id={queue_id}")
+    else:
+        logger.info(f"Начало генерации для queue_id={queue_id}")
+        
+        # Скачиваем изображения параллельно, до захвата слота OpenAI:
+        # generate_image занимает слот только на время запроса к API
+        input_images = []
+        if session['images']:
+            async with stage("download", DOWNLOAD_TIMEOUT_SECONDS, timings):
+                input_images = await download_images(bot_instance, session['images'])
+                
+                # Уменьшаем и перекодируем в пуле процессов, не блокируя event loop
+                input_images = await preprocess_images(input_images)
+        
+        # Генерируем изображение. Бюджет запроса к OpenAI задан в openai_service,
+        # этап включает и ожидание свободного слота
+        async with stage("openai", 0, timings):
+            result_image = await generate_image(session['prompt'], input_images)
+        await result_cache.put(result_cache_key(queue_id), result_image)
+        logger.info(f"Генерация завершена для queue_id={queue_id}")
+    
+    # Отправляем результат пользователю
+    footer = (
+        messages.GENERATION_SUCCESS_FOOTER_TEST 
+        if TEST_MODE 
+        else messages.GENERATION_SUCCESS_FOOTER_PAID
+    )
+    
+    async with stage("delivery", DELIVERY_TIMEOUT_SECONDS, timings):
+        await deliver_result(
+            queue_id,
+            queue_item['user_id'],
+            messages.GENERATION_SUCCESS.format(
+                prompt=session['prompt'],
+                footer=footer
+            ),
+            image=result_image
+        )
 
 
 async def process_queue_item(queue_item: Dict[str, Any]) -> None:
@@ -124,57 +475,42 @@ async def process_queue_item(queue_item: Dict[str, Any]) -> None:
     session_id = queue_item['session_id']
     user_id = queue_item['user_id']
     
+    session = None
+    timings: Dict[str, float] = {}
+    
     try:
         # Получаем данные сессии
         session = await session_repository.get_session(session_id)
         if not session:
             raise GenerationError("Сессия не найдена")
         
-        # Используем семафор для ограничения
-        async with generation_semaphore:
-            logger.info(f"Начало генерации для queue_id={queue_id}")
-            
-            # Проверяем что бот установлен
-            if not bot_instance:
-                raise GenerationError("Бот не инициализирован")
-            
-            # Скачиваем изображения если есть
-            input_images = []
-            if session['images']:
-                for file_id in session['images']:
-                    img_bytes = await download_image(bot_instance, file_id)
-                    input_images.append(img_bytes)
-            
-            # Генерируем изображение
-            result_image = await generate_image(session['prompt'], input_images)
-            
-            # Обновляем статус на "completed"
-            await queue_repository.update_queue_status(queue_id, 'completed')
-            logger.info(f"Генерация завершена для queue_id={queue_id}")
-            
-            # Отправляем результат пользователю
-            footer = (
-                messages.GENERATION_SUCCESS_FOOTER_TEST 
-                if TEST_MODE 
-                else messages.GENERATION_SUCCESS_FOOTER_PAID
-            )
-            
-            await bot_instance.send_photo(
-                chat_id=user_id,
-                photo=BufferedInputFile(result_image, filename="generated.png"),
-                caption=messages.GENERATION_SUCCESS.format(
-                    prompt=session['prompt'],
-                    footer=footer
-                ),
-                parse_mode="HTML"
-            )
-            
-            # Очищаем сессию
-            await payment_service.delete_session(session_id)
+        # Проверяем что бот установлен
+        if not bot_instance:
+            raise GenerationError("Бот не инициализирован")
+        
+        # Общий дедлайн задачи; этапы дополнительно ограничены своими бюджетами.
+        # При превышении обработка отменяется, слоты OpenAI и очереди освобождаются
+        async with stage("total", JOB_DEADLINE_SECONDS, timings):
+            await generate_and_deliver(queue_item, session, timings)
+        
+        # Обновляем статус на "completed" только после доставки
+        if not await queue_repository.update_queue_status(queue_id, 'completed', worker_id=WORKER_ID):
+            logger.warning(f"queue_id={queue_id} больше не арендована worker'ом {WORKER_ID}, статус не изменен")
+            return
+        
+        # Очищаем сессию
+        await payment_service.delete_session(session_id)
             
     except GenerationError as e:
         logger.error(f"Ошибка генерации для queue_id={queue_id}: {e}")
-        await queue_repository.update_queue_status(queue_id, 'failed', str(e))
+        # Временные ошибки повторяются без возврата оплаты
+        if await retry_later(queue_item, e):
+            return
+        
+        if not await queue_repository.update_queue_status(queue_id, 'failed', str(e), worker_id=WORKER_ID):
+            # Задачу обрабатывает другой worker - сообщение и возврат оплаты за ним
+            logger.warning(f"queue_id={queue_id} больше не арендована worker'ом {WORKER_ID}, статус не изменен")
+            return
         
         # Отправляем ошибку пользователю
         if bot_instance:
@@ -207,7 +543,13 @@ async def process_queue_item(queue_item: Dict[str, Any]) -> None:
                 
     except Exception as e:
         logger.error(f"Неожиданная ошибка для queue_id={queue_id}: {e}")
-        await queue_repository.update_queue_status(queue_id, 'failed', str(e))
+        if await retry_later(queue_item, e):
+            return
+        
+        if not await queue_repository.update_queue_status(queue_id, 'failed', str(e), worker_id=WORKER_ID):
+            # Задачу обрабатывает другой worker - сообщение и возврат оплаты за ним
+            logger.warning(f"queue_id={queue_id} больше не арендована worker'ом {WORKER_ID}, статус не изменен")
+            return
         
         # Отправляем ошибку пользователю
         if bot_instance:
@@ -239,19 +581,33 @@ async def process_queue_item(queue_item: Dict[str, Any]) -> None:
                     )
                 
     finally:
-        # Удаляем из активных задач
+        # Освобождаем слот и будим worker, если он ждал свободного слота
         active_tasks.pop(queue_id, None)
+        if _waiting_for_slot:
+            notify_queue()
         
-        # Worker сам продолжит обработку следующего элемента
+        if timings:
+            logger.info(f"Длительность этапов queue_id={queue_id}: {timings}")
+            try:
+                # Потерявший аренду worker не перезаписывает замеры нового владельца.
+                # После schedule_retry задача ничья - сохранятся замеры следующей попытки
+                await queue_repository.save_timings(queue_id, timings, worker_id=WORKER_ID)
+            except Exception as e:
+                logger.warning(f"Не удалось сохранить длительность этапов queue_id={queue_id}: {e}")
 
 
 async def restore_queue() -> None:
     """Восстановить обработку очереди при старте бота"""
     # Очищаем зависшие задачи
-    stale_count = await queue_repository.cleanup_stale_items()
+    stale_count = await queue_repository.cleanup_stale_items(QUEUE_STALE_MINUTES)
     if stale_count > 0:
         logger.info(f"Очищено зависших задач: {stale_count}")
     
+    # Возвращаем задачи, аренда которых истекла (worker упал)
+    reclaimed_count = await queue_repository.reclaim_expired_leases()
+    if reclaimed_count > 0:
+        logger.info(f"Возвращено в очередь задач с истекшей арендой: {reclaimed_count}")
+    
     # Получаем количество задач в очереди
     pending_count = await queue_repository.get_pending_count()
     if pending_count > 0:
@@ -263,13 +619,14 @@ async def restore_queue() -> None:
 
 async def cancel_all_tasks() -> None:
     """Отменить все активные задачи (для graceful shutdown)"""
-    # Останавливаем worker
-    if _queue_worker_task and not _queue_worker_task.done():
-        _queue_worker_task.cancel()
-        try:
-            await _queue_worker_task
-        except asyncio.CancelledError:
-            pass
+    # Останавливаем worker и продление аренды
+    for task in (_queue_worker_task, _heartbeat_task):
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
     
     # Отменяем активные задачи обработки
     for task in active_tasks.values():
@@ -280,4 +637,10 @@ async def cancel_all_tasks() -> None:
         await asyncio.gather(*active_tasks.values(), return_exceptions=True)
     
     active_tasks.clear()
+    
+    # Возвращаем прерванные задачи в очередь, чтобы их подхватил другой worker
+    released = await queue_repository.release_worker_items(WORKER_ID)
+    if released > 0:
+        logger.info(f"Возвращено в очередь прерванных задач: {released}")
+    
     logger.info("Все активные задачи отменены")
\ No newline at end of file
@@ -1,12 +1,97 @@
+import asyncio
 import aiohttp
+from typing import Any, Dict, List, Optional, Union
 from aiogram import Bot
-from ..config import BOT_TOKEN
+from ..config import (
+    logger, DOWNLOAD_CONCURRENCY_PER_JOB,
+    TELEGRAM_HTTP_LIMIT, TELEGRAM_HTTP_LIMIT_PER_HOST, TELEGRAM_HTTP_KEEPALIVE,
+    IMAGE_CACHE_MEMORY_MB, IMAGE_CACHE_DIR, IMAGE_CACHE_DISK_MB
+)
+from .image_cache import ImageCache
 
-async def download_image(bot: Bot, file_id: str) -> bytes:
-    """Скачать изображение из Telegram"""
+# Долгоживущая HTTP-сессия для скачивания файлов (keep-alive, пул соединений)
+_http_session: Optional[aiohttp.ClientSession] = None
+
+# Кэш скачанных изображений по file_unique_id
+image_cache = ImageCache(
+    memory_limit_bytes=IMAGE_CACHE_MEMORY_MB * 1024 * 1024,
+    disk_dir=IMAGE_CACHE_DIR or None,
+    disk_limit_bytes=IMAGE_CACHE_DISK_MB * 1024 * 1024,
+    name="inputs"
+)
+
+
+async def start_http_session() -> aiohttp.ClientSession:
+    """Создать общую HTTP-сессию для скачивания файлов из Telegram"""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=TELEGRAM_HTTP_LIMIT,
+            limit_per_host=TELEGRAM_HTTP_LIMIT_PER_HOST,
+            keepalive_timeout=TELEGRAM_HTTP_KEEPALIVE,
+            ttl_dns_cache=300
+        )
+        _http_session = aiohttp.ClientSession(connector=connector)
+        logger.info(
+            f"HTTP-сессия для файлов Telegram создана "
+            f"(limit={TELEGRAM_HTTP_LIMIT}, per_host={TELEGRAM_HTTP_LIMIT_PER_HOST})"
+        )
+    return _http_session
+
+
+async def close_http_session() -> None:
+    """Закрыть общую HTTP-сессию (для graceful shutdown)"""
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+
+async def download_image(bot: Bot, file_id: str, file_unique_id: Optional[str] = None) -> bytes:
+    """Скачать изображение из Telegram (с кэшем по file_unique_id)"""
+    if file_unique_id:
+        cached = await image_cache.get(file_unique_id)
+        if cached is not None:
+            return cached
+    
+    data = await _fetch_file(bot, file_id)
+    
+    if file_unique_id:
+        await image_cache.put(file_unique_id, data)
+    return data
+
+
+async def _fetch_file(bot: Bot, file_id: str) -> bytes:
+    """Скачать файл из Telegram по file_id"""
     file = await bot.get_file(file_id)
     file_path = file.file_path
-    
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file_path}") as resp:
-            return await resp.read()
\ No newline at end of file
+
+    if _http_session is None or _http_session.closed or bot.session.api.is_local:
+        # Общая сессия не запущена или файлы лежат локально (свой Bot API сервер) -
+        # скачиваем через транспорт самого бота
+        buffer = await bot.download_file(file_path)
+        return buffer.getvalue()
+
+    # URL строится из настроек API бота, поэтому работает и со своим Bot API сервером
+    url = bot.session.api.file_url(bot.token, file_path)
+    async with _http_session.get(url) as resp:
+        resp.raise_for_status()
+        return await resp.read()
+
+
+async def download_images(
+    bot: Bot,
+    images: List[Union[str, Dict[str, Any]]],
+    concurrency: int = DOWNLOAD_CONCURRENCY_PER_JOB
+) -> List[bytes]:
+    """Скачать несколько изображений сессии параллельно, сохранив порядок"""
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def fetch(image: Union[str, Dict[str, Any]]) -> bytes:
+        # В старых сессиях изображения хранились как строки file_id
+        if isinstance(image, str):
+            image = {'file_id': image}
+        async with semaphore:
+            return await download_image(bot, image['file_id'], image.get('file_unique_id'))
+
+    return list(await asyncio.gather(*(fetch(image) for image in images)))
@@ -0,0 +1,135 @@
+"""
+Прием обновлений Telegram через webhook.
+
+aiohttp-сервер проверяет секретный токен и передает каждое обновление в
+Dispatcher отдельной задачей (параллелизм и порядок для пользователя задает
+OrderedDispatchMiddleware). Если необработанных обновлений больше
+DISPATCH_MAX_PENDING, сервер отвечает 503 и Telegram повторит доставку позже.
+"""
+import asyncio
+import signal
+from typing import Optional, Set
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from .config import (
+    logger,
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_DRAIN_SECONDS,
+    DISPATCH_MAX_PENDING
+)
+from .services import queue_service
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """HTTP-сервер webhook с ограничением числа необработанных обновлений"""
+
+    def __init__(self, dp: Dispatcher, bot: Bot) -> None:
+        self.dp = dp
+        self.bot = bot
+        self.max_pending = max(1, DISPATCH_MAX_PENDING)
+        self.accepting = False
+        self.rejected = 0
+        self._tasks: Set[asyncio.Task] = set()
+        self._runner: Optional[web.AppRunner] = None
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        """Принять обновление от Telegram"""
+        if WEBHOOK_SECRET and request.headers.get(SECRET_HEADER) != WEBHOOK_SECRET:
+            return web.Response(status=401)
+
+        # Во время остановки и при переполнении Telegram повторит доставку
+        if not self.accepting:
+            return web.Response(status=503)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            logger.warning(f"Некорректное обновление webhook: {e}")
+            return web.Response(status=400)
+
+        if len(self._tasks) >= self.max_pending:
+            self.rejected += 1
+            logger.warning(f"Необработанных обновлений {len(self._tasks)}, update_id={update.update_id} отклонен")
+            return web.Response(status=503)
+
+        task = asyncio.create_task(self._process_update(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process_update(self, update: Update) -> None:
+        """Передать обновление в Dispatcher"""
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            logger.error(f"Ошибка обработки update_id={update.update_id}: {e}")
+
+    async def start(self) -> None:
+        """Запустить HTTP-сервер и зарегистрировать webhook"""
+        await self.dp.emit_startup(bot=self.bot, dispatcher=self.dp)
+
+        app = web.Application()
+        app.router.add_post(WEBHOOK_PATH, self.handle_update)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+        self.accepting = True
+
+        await self.bot.set_webhook(
+            url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=self.dp.resolve_used_update_types()
+        )
+        logger.info(f"Webhook запущен на {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    async def stop(self) -> None:
+        """Перестать принимать обновления и дообработать принятые"""
+        self.accepting = False
+
+        # Новые генерации не начинаем, пока дообрабатываем обновления
+        await queue_service.pause_queue()
+
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=WEBHOOK_DRAIN_SECONDS)
+            if pending:
+                logger.warning(f"Не дообработано обновлений при остановке: {len(pending)}")
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+        # Хранилище FSM сохраняет изменения при остановке диспетчера
+        await self.dp.emit_shutdown(bot=self.bot, dispatcher=self.dp)
+        logger.info("Webhook остановлен")
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot) -> None:
+    """Работать в режиме webhook до SIGTERM/SIGINT"""
+    server = WebhookServer(dp, bot)
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass  # Windows
+
+    try:
+        await server.start()
+        await stop_event.wait()
+    finally:
+        # Сессию бота закрывает on_shutdown после остановки задач очереди
+        await server.stop()
@@ -0,0 +1,57 @@
+"""
+Отдельный процесс обработки очереди генераций.
+
+Бот (main.py) только принимает запросы и добавляет задачи в generation_queue,
+а один или несколько таких процессов забирают задачи с арендой и выполняют генерацию.
+"""
+import asyncio
+import signal
+from aiogram import Bot
+
+from .config import BOT_TOKEN, logger
+from .database import setup_database
+from .repositories.pool import open_pools, close_pools
+from .services import queue_service
+from .services.image_service import shutdown_executor
+from .services.telegram_service import start_http_session, close_http_session
+
+
+async def run_worker() -> None:
+    """Запустить обработку очереди без приема обновлений Telegram"""
+    await setup_database()
+    await open_pools()
+    await start_http_session()
+    
+    # Бот нужен для скачивания изображений и отправки результатов
+    bot = Bot(token=BOT_TOKEN)
+    queue_service.set_bot(bot)
+    queue_service.set_worker_enabled(True)
+    
+    # Корректно завершаемся по SIGTERM/SIGINT
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass  # Windows
+    
+    await queue_service.restore_queue()
+    await queue_service.start_queue_worker()
+    logger.info(f"Worker очереди запущен: {queue_service.WORKER_ID}")
+    
+    try:
+        await stop_event.wait()
+    finally:
+        logger.info("Остановка worker'а очереди...")
+        await queue_service.pause_queue()
+        await queue_service.cancel_all_tasks()
+        await close_pools()
+        await close_http_session()
+        shutdown_executor()
+        await bot.session.close()
+        logger.info("Worker очереди остановлен")
+
+
+if __name__ == "__main__":
+    asyncio.run(run_worker())
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
-from bot import main
 
 if __name__ == "__main__":
+    # Импорт под условием: процессы spawn повторно импортируют этот файл
     import asyncio
+    from bot.app import main
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,10 @@
+"""
+Тесты конкурентных компонентов бота.
+
+Запуск: python -m unittest discover tests (или python -m pytest tests).
+bot.config требует токены при импорте - подставляем фиктивные.
+"""
+import os
+
+os.environ.setdefault("BOT_TOKEN", "123456:TEST-TOKEN")
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
@@ -0,0 +1,29 @@
+"""
+Общие заготовки тестов: временная БД со всеми миграциями
+"""
+import os
+import tempfile
+import unittest
+
+from bot.migrations.migration_system import MigrationSystem
+from bot.repositories.pool import _pools
+from bot.repositories.sqlite import init_database
+
+
+class DatabaseTestCase(unittest.IsolatedAsyncioTestCase):
+    """Тест с отдельной БД во временном каталоге (self.db_path)"""
+
+    async def asyncSetUp(self) -> None:
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self._tmp_dir.name, "bot_data.db")
+        await MigrationSystem(self.db_path).migrate()
+        await init_database(self.db_path)
+        # Очистки выполняются в обратном порядке - БД закрывается последней
+        self.addAsyncCleanup(self._close_database)
+
+    async def _close_database(self) -> None:
+        # Закрытый пул повторно не открывается - убираем его из реестра
+        pool = _pools.pop(self.db_path, None)
+        if pool is not None:
+            await pool.close()
+        self._tmp_dir.cleanup()
@@ -0,0 +1,84 @@
+import asyncio
+import time
+import unittest
+
+import tests  # noqa: F401
+from bot.services.concurrency import AdaptiveLimiter
+
+
+class AdaptiveLimiterTest(unittest.IsolatedAsyncioTestCase):
+
+    def test_rate_limit_halves_limit_once_per_overload(self) -> None:
+        limiter = AdaptiveLimiter(8, max_limit=20)
+        started_at = time.monotonic()
+
+        limiter.record_rate_limited(started_at)
+        self.assertEqual(limiter.capacity, 4)
+
+        # Запрос, начатый до уменьшения, повторно лимит не уменьшает
+        limiter.record_rate_limited(started_at)
+        self.assertEqual(limiter.capacity, 4)
+
+        limiter.record_rate_limited(time.monotonic())
+        self.assertEqual(limiter.capacity, 2)
+
+    def test_limit_respects_bounds(self) -> None:
+        limiter = AdaptiveLimiter(2, min_limit=1, max_limit=3)
+        for _ in range(100):
+            limiter.record_success(time.monotonic())
+        self.assertEqual(limiter.capacity, 3)
+
+        for _ in range(10):
+            limiter.record_rate_limited(time.monotonic())
+        self.assertEqual(limiter.capacity, 1)
+
+    def test_no_increase_when_quota_is_exhausted(self) -> None:
+        limiter = AdaptiveLimiter(2, max_limit=10)
+        limiter.in_flight = 2
+        for _ in range(20):
+            limiter.record_success(time.monotonic(), remaining_requests=1)
+        self.assertEqual(limiter.capacity, 2)
+
+    def test_latency_window_restarts_after_decrease(self) -> None:
+        limiter = AdaptiveLimiter(10, max_limit=10, latency_target=1.0)
+        slow_start = time.monotonic() - 5
+        for _ in range(10):
+            limiter.record_success(slow_start)
+        self.assertEqual(limiter.capacity, 9)
+        self.assertIsNone(limiter.latency_percentile(0.9))
+
+        # Медленные ответы запросов, начатых до уменьшения, его не повторяют
+        for _ in range(10):
+            limiter.record_success(slow_start)
+        self.assertGreaterEqual(limiter.capacity, 9)
+        self.assertIsNone(limiter.latency_percentile(0.9))
+
+    async def test_capacity_limits_concurrent_slots(self) -> None:
+        limiter = AdaptiveLimiter(2, max_limit=2)
+        running = 0
+        peak = 0
+
+        async def request() -> None:
+            nonlocal running, peak
+            async with limiter.slot():
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*(request() for _ in range(10)))
+        self.assertEqual(peak, 2)
+        self.assertEqual(limiter.in_flight, 0)
+
+    async def test_retry_after_pauses_new_requests(self) -> None:
+        limiter = AdaptiveLimiter(4)
+        limiter.record_rate_limited(time.monotonic(), retry_after=0.1)
+
+        started = time.monotonic()
+        await limiter.acquire()
+        limiter.release()
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+from aiogram.fsm.storage.base import StorageKey
+
+from bot.repositories.fsm_storage import SQLiteFSMStorage
+from tests.support import DatabaseTestCase
+
+
+def make_key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+
+class SQLiteFSMStorageTest(DatabaseTestCase):
+
+    def create_storage(self, **kwargs) -> SQLiteFSMStorage:
+        storage = SQLiteFSMStorage(self.db_path, flush_interval=3600, **kwargs)
+        self.addAsyncCleanup(storage.close)
+        return storage
+
+    async def test_state_survives_restart(self) -> None:
+        storage = self.create_storage()
+        await storage.set_state(make_key(1), "waiting_for_prompt")
+        await storage.set_data(make_key(1), {"prompt": "кот"})
+        await storage.close()
+
+        restarted = self.create_storage()
+        self.assertEqual(await restarted.get_state(make_key(1)), "waiting_for_prompt")
+        self.assertEqual(await restarted.get_data(make_key(1)), {"prompt": "кот"})
+
+    async def test_cache_is_bounded_without_losing_changes(self) -> None:
+        storage = self.create_storage(max_entries=2)
+        for user_id in range(5):
+            await storage.set_state(make_key(user_id), f"state-{user_id}")
+        await storage.flush()
+        await storage.get_state(make_key(10))
+
+        self.assertLessEqual(len(storage._cache), 2)
+        for user_id in range(5):
+            self.assertEqual(await storage.get_state(make_key(user_id)), f"state-{user_id}")
+
+    async def test_failed_flush_keeps_changes(self) -> None:
+        storage = self.create_storage(max_entries=1)
+        await storage.set_state(make_key(1), "waiting_for_prompt")
+        await storage.get_state(make_key(2))
+
+        writer = storage.pool.writer
+
+        def failing_writer():
+            # Вытеснение во время записи не должно забыть записываемый ключ
+            storage._evict()
+            raise OSError("disk full")
+
+        storage.pool.writer = failing_writer
+        with self.assertRaises(OSError):
+            await storage.flush()
+        storage.pool.writer = writer
+
+        self.assertEqual(await storage.flush(), 1)
+        restarted = self.create_storage()
+        self.assertEqual(await restarted.get_state(make_key(1)), "waiting_for_prompt")
@@ -0,0 +1,74 @@
+import asyncio
+import unittest
+
+import tests  # noqa: F401
+from bot.services.prompt_cache import PromptCache
+
+
+class PromptCacheTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.cache = PromptCache(ttl_seconds=60, max_entries=10)
+        self.calls = 0
+
+    async def slow_factory(self) -> bytes:
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return b"image-%d" % self.calls
+
+    async def test_identical_requests_share_one_call(self) -> None:
+        results = await asyncio.gather(
+            *(self.cache.get_or_create("key", self.slow_factory) for _ in range(5))
+        )
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(set(results), {b"image-1"})
+
+        # Готовый результат отдается из кэша
+        self.assertEqual(await self.cache.get_or_create("key", self.slow_factory), b"image-1")
+        self.assertEqual(self.calls, 1)
+
+    async def test_waiter_takes_over_when_leader_is_cancelled(self) -> None:
+        leader = asyncio.create_task(self.cache.get_or_create("key", self.slow_factory))
+        await asyncio.sleep(0.01)
+        followers = [
+            asyncio.create_task(self.cache.get_or_create("key", self.slow_factory))
+            for _ in range(3)
+        ]
+        await asyncio.sleep(0.01)
+
+        leader.cancel()
+        results = await asyncio.gather(leader, *followers, return_exceptions=True)
+
+        self.assertIsInstance(results[0], asyncio.CancelledError)
+        self.assertEqual(results[1:], [b"image-2"] * 3)
+        self.assertEqual(self.calls, 2)
+
+    async def test_cancelled_waiter_does_not_cancel_leader(self) -> None:
+        leader = asyncio.create_task(self.cache.get_or_create("key", self.slow_factory))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(self.cache.get_or_create("key", self.slow_factory))
+        await asyncio.sleep(0.01)
+
+        follower.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await follower
+        self.assertEqual(await leader, b"image-1")
+
+    async def test_error_is_shared_and_not_cached(self) -> None:
+        async def failing() -> bytes:
+            self.calls += 1
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(
+            *(self.cache.get_or_create("key", failing) for _ in range(3)),
+            return_exceptions=True
+        )
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertEqual(self.calls, 1)
+
+        self.assertEqual(await self.cache.get_or_create("key", self.slow_factory), b"image-2")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+
+from bot.repositories.sqlite import SQLiteQueueRepository
+from tests.support import DatabaseTestCase
+
+
+class QueueLeaseTest(DatabaseTestCase):
+
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self.repository = SQLiteQueueRepository(self.db_path)
+
+    async def expire_lease(self, queue_id: int) -> None:
+        past = (datetime.now() - timedelta(seconds=1)).isoformat()
+        async with self.repository.pool.writer() as db:
+            await db.execute(
+                "UPDATE generation_queue SET lease_expires_at = ? WHERE id = ?", (past, queue_id)
+            )
+            await db.commit()
+
+    async def test_claim_takes_each_item_once_in_priority_order(self) -> None:
+        low = await self.repository.add_to_queue("low", 1)
+        high = await self.repository.add_to_queue("high", 2, priority=1)
+
+        first = await self.repository.claim_batch(1, "worker-a", 60)
+        second = await self.repository.claim_batch(5, "worker-b", 60)
+
+        self.assertEqual([item["id"] for item in first], [high])
+        self.assertEqual([item["id"] for item in second], [low])
+        self.assertEqual(first[0]["attempts"], 1)
+        self.assertEqual(await self.repository.claim_batch(5, "worker-c", 60), [])
+
+    async def test_expired_lease_is_reclaimed_and_counts_attempt(self) -> None:
+        queue_id = await self.repository.add_to_queue("session", 1)
+        await self.repository.claim_batch(1, "worker-a", 60)
+
+        # Действующую аренду не забирают
+        self.assertEqual(await self.repository.reclaim_expired_leases(), 0)
+
+        await self.expire_lease(queue_id)
+        self.assertEqual(await self.repository.reclaim_expired_leases(), 1)
+
+        items = await self.repository.claim_batch(1, "worker-b", 60)
+        self.assertEqual(items[0]["id"], queue_id)
+        self.assertEqual(items[0]["attempts"], 2)
+
+    async def test_lost_lease_blocks_previous_owner(self) -> None:
+        queue_id = await self.repository.add_to_queue("session", 1)
+        await self.repository.claim_batch(1, "worker-a", 60)
+        await self.expire_lease(queue_id)
+        await self.repository.reclaim_expired_leases()
+        await self.repository.claim_batch(1, "worker-b", 60)
+
+        self.assertEqual(await self.repository.renew_leases("worker-a", [queue_id], 60), [])
+        self.assertEqual(await self.repository.renew_leases("worker-b", [queue_id], 60), [queue_id])
+        self.assertFalse(await self.repository.update_queue_status(queue_id, "completed", worker_id="worker-a"))
+        self.assertFalse(await self.repository.schedule_retry(queue_id, 0, "error", worker_id="worker-a"))
+        self.assertFalse(await self.repository.set_result_file_id(queue_id, "file", worker_id="worker-a"))
+        self.assertFalse(await self.repository.save_timings(queue_id, {"total": 1.0}, worker_id="worker-a"))
+        self.assertTrue(await self.repository.update_queue_status(queue_id, "completed", worker_id="worker-b"))
+
+    async def test_retry_waits_for_not_before(self) -> None:
+        queue_id = await self.repository.add_to_queue("session", 1)
+        await self.repository.claim_batch(1, "worker-a", 60)
+        self.assertTrue(await self.repository.schedule_retry(queue_id, 60, "error", worker_id="worker-a"))
+
+        self.assertEqual(await self.repository.claim_batch(1, "worker-b", 60), [])
+
+        async with self.repository.pool.writer() as db:
+            await db.execute(
+                "UPDATE generation_queue SET not_before = ? WHERE id = ?",
+                ((datetime.now() - timedelta(seconds=1)).isoformat(), queue_id)
+            )
+            await db.commit()
+        items = await self.repository.claim_batch(1, "worker-b", 60)
+        self.assertEqual(items[0]["id"], queue_id)
+        self.assertEqual(items[0]["attempts"], 2)
+
+    async def test_positions_skip_deferred_items(self) -> None:
+        deferred = await self.repository.add_to_queue("deferred", 1)
+        await self.repository.add_to_queue("first", 2)
+        await self.repository.add_to_queue("second", 3)
+        await self.repository.claim_batch(1, "worker-a", 60)
+        await self.repository.schedule_retry(deferred, 60, "error", worker_id="worker-a")
+
+        positions = await self.repository.get_queue_positions(["deferred", "first", "second"])
+        self.assertEqual(positions, {"first": 1, "second": 2})
@@ -0,0 +1,80 @@
+import asyncio
+import unittest
+
+import tests  # noqa: F401
+from bot.middleware.rate_limit import SlidingWindowCounter, SQLiteRateLimitBackend
+from tests.support import DatabaseTestCase
+
+
+class SlidingWindowCounterTest(unittest.TestCase):
+
+    def test_limit_within_window(self) -> None:
+        counter = SlidingWindowCounter(3, 60)
+        self.assertEqual([counter.hit(1, now=0.0) for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertGreater(counter.hit(1, now=1.0), 0)
+        # Другие пользователи считаются отдельно
+        self.assertEqual(counter.hit(2, now=1.0), 0.0)
+
+    def test_previous_window_is_weighted(self) -> None:
+        counter = SlidingWindowCounter(4, 60)
+        for _ in range(4):
+            counter.hit(1, now=0.0)
+        # Половина предыдущего окна: оценка 4 * 0.5 = 2 - еще 2 запроса
+        self.assertEqual(counter.hit(1, now=90.0), 0.0)
+        self.assertEqual(counter.hit(1, now=90.0), 0.0)
+        self.assertGreater(counter.hit(1, now=90.0), 0)
+
+    def test_users_are_capped(self) -> None:
+        counter = SlidingWindowCounter(1, 60, max_users=2)
+        for user_id in range(5):
+            counter.hit(user_id, now=0.0)
+        self.assertEqual(len(counter._users), 2)
+
+
+class SQLiteRateLimitBackendTest(DatabaseTestCase):
+
+    def create_backend(self, max_users: int = 100) -> SQLiteRateLimitBackend:
+        backend = SQLiteRateLimitBackend(
+            "test", 4, 3600, db_path=self.db_path, sync_interval=0.05, max_users=max_users
+        )
+        self.addAsyncCleanup(backend.close)
+        return backend
+
+    async def test_limit_is_shared_between_instances(self) -> None:
+        first = self.create_backend()
+        second = self.create_backend()
+
+        self.assertEqual([await first.hit(1) for _ in range(2)], [0.0, 0.0])
+        await first.sync()
+
+        results = [await second.hit(1) for _ in range(3)]
+        self.assertEqual(results[:2], [0.0, 0.0])
+        self.assertGreater(results[2], 0)
+
+    async def test_snapshot_is_not_reread_per_request(self) -> None:
+        backend = self.create_backend()
+        reads = 0
+        read = backend._read
+
+        async def counting_read(keys, since_window):
+            nonlocal reads
+            keys = list(keys)
+            if keys == [1] and 1 not in backend._shared:
+                reads += 1
+            return await read(keys, since_window)
+
+        backend._read = counting_read
+        for _ in range(3):
+            await backend.hit(1)
+            await asyncio.sleep(0.1)  # Несколько синхронизаций между запросами
+        self.assertEqual(reads, 1)
+
+    async def test_snapshots_are_capped(self) -> None:
+        backend = self.create_backend(max_users=3)
+        for user_id in range(10):
+            await backend.hit(user_id)
+        self.assertEqual(len(backend._shared), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,7 @@
+#!/usr/bin/env python3
+
+if __name__ == "__main__":
+    # Импорт под условием: процессы spawn повторно импортируют этот файл
+    import asyncio
+    from bot.worker import run_worker
+    asyncio.run(run_worker())
\ No newline at end of file